@@ -1,20 +1,292 @@
 import random
 import itertools
 import copy
-from checkers import Piece
 from checkers import Board
+from checkers import BitBoard
+from checkers import BLACK_PAWN, BLACK_KING, WHITE_PAWN, WHITE_KING
+from checkers import SQUARE_POSITIONS
 import string
+import time
+import concurrent.futures
+import threading
+import collections
+import json
+import config
+
+# Zobrist keys completing the hash of a board into a transposition key:
+# one for white to move and one for white being the maximizing side.
+_zobrist_random = random.Random(20190102)
+ZOBRIST_WHITE_TURN = _zobrist_random.getrandbits(64)
+ZOBRIST_WHITE_MAX = _zobrist_random.getrandbits(64)
+
+# The bound types of the values stored in the transposition table.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable(object):
+    """
+    A transposition table of fixed size for the alpha-beta search. Each slot
+    holds a tuple (key, depth, bound, value, move, generation) where depth is
+    the remaining depth of the search below the node, bound tells if value
+    is EXACT or a LOWER/UPPER bound and move is the best move found.
+    A slot is replaced by a new entry if it is empty, holds the same key, was
+    stored by an older search or was searched less deeply.
+    """
+
+    def __init__(self, size = None):
+        """
+        The size defaults to config.transposition_table_size.
+        """
+        if size is None:
+            size = config.transposition_table_size
+        if size < 1:
+            raise ValueError("A transposition table needs at least 1 entry.")
+        self._size = size
+        self._slots = [None] * size
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_size(self):
+        """
+        Returns the number of slots of the table.
+        """
+        return self._size
+
+    def new_search(self):
+        """
+        Starts a new search: the entries of the previous ones become the
+        first to be replaced.
+        """
+        self._generation += 1
+
+    def clear(self):
+        """
+        Empties the table and resets its counters.
+        """
+        self._slots = [None] * self._size
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """
+        Returns the entry stored for the given key, or None.
+        """
+        entry = self._slots[key % self._size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        """
+        Stores the result of a search according to the replacement policy.
+        """
+        index = key % self._size
+        entry = self._slots[index]
+        if entry is None or entry[0] == key \
+                or entry[5] != self._generation or depth >= entry[1]:
+            self._slots[index] = (key, depth, bound, value, move,
+                                  self._generation)
+
+transposition_table = TranspositionTable()
+
+# The SearchStats of the last search of get_next_move(), if collected.
+last_search_stats = None
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchContext(object):
+    """
+    The state shared by all the nodes of a search: the transposition table
+    (transposition_table by default), the wall-clock deadline, as given by
+    time.time(), after which the search is abandoned, the move ordering
+    tables and the number of nodes visited.
+    With exact_depth, only the table values searched at exactly the depth
+    asked for are used, which makes the value of a search independent of
+    what the table held before it.
+    killers[ply] holds the last two quiet moves that caused a cutoff at
+    that ply, and history maps the (start, end) positions of a quiet move
+    to a score growing with the depth of the cutoffs it caused.
+    The nodes fill in the SearchStats given as stats, if any, and probe the
+    endgame tablebase of get_tablebase(), if any.
+    """
+
+    def __init__(self, table = None, deadline = None, exact_depth = False, \
+                 stats = None):
+        self.table = table if table is not None else transposition_table
+        self.deadline = deadline
+        self.exact_depth = exact_depth
+        self.stats = stats
+        self.nodes = 0
+        self.killers = []
+        self.history = {}
+        self.tablebase = get_tablebase()
+
+    def is_stopped(self):
+        """
+        Returns True once the search is to be abandoned before its deadline.
+        A search is never stopped by default, see the subclasses.
+        """
+        return False
+
+    def visit(self):
+        """
+        Counts a node and raises SearchTimeout once the deadline is passed
+        or is_stopped() returns True. Both are only checked every 256 nodes.
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0 and (self.is_stopped() \
+                or (self.deadline is not None \
+                    and time.time() > self.deadline)):
+            raise SearchTimeout()
+
+    def cutoff(self, action, ply, depth):
+        """
+        Records a quiet move that caused a cutoff at the given ply with depth
+        plies left to search.
+        """
+        action = tuple(action)
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        key = (action[0], action[-1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+class SearchStats(object):
+    """
+    The statistics of one or more searches: the nodes visited, the leaf
+    evaluations, the tablebase hits, the beta cutoffs per ply and how many
+    of them the first move searched caused, the transposition table hits
+    and the cutoffs they gave, the principal variation search re-searches,
+    the deepest ply reached, the depth completed and the time spent
+    generating moves, evaluating leaves and making and unmaking moves.
+    They are only collected for a search whose SearchContext holds a
+    SearchStats, every node otherwise only tests that it has none.
+    """
+
+    PHASES = ('movegen', 'eval', 'make')
+
+    def __init__(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.tablebase_hits = 0
+        self.cutoffs = []
+        self.first_move_cutoffs = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.researches = 0
+        self.max_ply = 0
+        self.depth = 0
+        self.phases = dict([(phase, 0.0) for phase in self.PHASES])
+        self.seconds = 0.0
+        self._start = None
+        self._nodes = 0
+        self._hits = 0
+
+    def start(self, context):
+        """
+        Starts timing the search of the given context.
+        """
+        self._start = time.time()
+        self._nodes = context.nodes
+        self._hits = context.table.hits
+
+    def stop(self, context):
+        """
+        Stops timing the search of the given context, and adds its nodes and
+        table hits since start().
+        """
+        self.seconds += time.time() - self._start
+        self.nodes += context.nodes - self._nodes
+        self.tt_hits += context.table.hits - self._hits
+        self._start = None
+
+    def visit(self, ply):
+        """
+        Records a node visited at the given ply.
+        """
+        if ply > self.max_ply:
+            self.max_ply = ply
+
+    def timed(self, phase, function, *args):
+        """
+        Returns function(*args), and adds the time it took to the phase.
+        """
+        start = time.time()
+        result = function(*args)
+        self.phases[phase] += time.time() - start
+        return result
+
+    def evaluate(self, state, captures = None):
+        """
+        Returns the utility() of a leaf, timed in the eval phase.
+        """
+        self.evaluations += 1
+        start = time.time()
+        value = utility(state, captures)
+        self.phases['eval'] += time.time() - start
+        return value
+
+    def cutoff(self, ply, index):
+        """
+        Records a beta cutoff at the given ply caused by the index-th move
+        searched.
+        """
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+        self.cutoffs[ply] += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+    def get_first_move_cutoff_rate(self):
+        """
+        Returns the share of the cutoffs caused by the first move searched,
+        which measures the move ordering.
+        """
+        cutoffs = sum(self.cutoffs)
+        return self.first_move_cutoffs / float(cutoffs) if cutoffs else 0.0
+
+    def get_nps(self):
+        """
+        Returns the number of nodes visited per second.
+        """
+        return int(self.nodes / self.seconds) if self.seconds > 0 else 0
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary, ready to be dumped as JSON.
+        """
+        return {
+            'nodes': self.nodes,
+            'evaluations': self.evaluations,
+            'tablebase_hits': self.tablebase_hits,
+            'cutoffs': list(self.cutoffs),
+            'first_move_cutoff_rate': \
+                round(self.get_first_move_cutoff_rate(), 4),
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'researches': self.researches,
+            'max_ply': self.max_ply,
+            'depth': self.depth,
+            'phases': dict([(phase, round(seconds, 4)) \
+                            for (phase, seconds) in self.phases.items()]),
+            'seconds': round(self.seconds, 4),
+            'nps': self.get_nps(),
+        }
 
 def allowed_moves(board, color):
-    b = Board(8)
+    b = BitBoard(8)
     initialize(b, board)
     if color == 'b':
         color = 'black'
     else:
         color = 'white'
-    hints = get_hints(b, color)
-    hints = convert_positions(hints)
-    return(hints)
+    return [list(move) for move in get_legal_moves(b, color)]
 
 def play(board, color):
     """
@@ -27,17 +299,14 @@ def play(board, color):
     # because otherwise the game is over and
     # 'play' would not be called by main.py
 
-    b = Board(8)
+    b = BitBoard(8)
     initialize(b, board)
     if color == 'b':
         turn = 'black'
     else:
         turn = 'white'
     choice = get_next_move(b, turn)
-    choice = list(choice)
-    for i in range(0, len(choice)):
-        choice[i] = indexify(choice[i])
-    return choice
+    return list(choice)
 
 
 def convert_positions(l):
@@ -76,18 +345,16 @@ def get_moves(board, row, col, is_sorted = False):
             the final returning list must be sorted. Remember that the list
             is a list of string positions.
     """
-    down, up = [(+1, -1), (+1, +1)], [(-1, -1), (-1, +1)]
     length = board.get_length()
     piece = board.get(row, col)
     if piece:
-        bottom = [ deindexify(row + x, col + y) for (x, y) in down \
-                      if (0 <= (row + x) < length) \
-                          and (0 <= (col + y) < length) \
-                          and board.is_free(row + x, col + y)]
-        top = [ deindexify(row + x, col + y) for (x, y) in up \
-                   if (0 <= (row + x) < length) \
-                       and (0 <= (col + y) < length) \
-                       and board.is_free(row + x, col + y)]
+        steps = get_move_tables(length)[(piece.color(), True)][0]
+        bottom = [ deindexify(row_to, col_to) \
+                      for (row_to, col_to) in steps[row * length + col] \
+                      if row_to > row and board.is_free(row_to, col_to)]
+        top = [ deindexify(row_to, col_to) \
+                   for (row_to, col_to) in steps[row * length + col] \
+                   if row_to < row and board.is_free(row_to, col_to)]
         return (sorted(bottom + top) if piece.is_king() else \
                 (sorted(bottom) if piece.is_black() else sorted(top))) \
                     if is_sorted else (bottom + top if piece.is_king() else \
@@ -118,24 +385,26 @@ def get_jumps(board, row, col, is_sorted = False):
             the final returning list must be sorted. Remember that the list
             is a list of string positions.
     """
-    down, up = [(+1, -1), (+1, +1)], [(-1, -1), (-1, +1)]
     length = board.get_length()
     piece = board.get(row, col)
     if piece:
+        jumps = get_move_tables(length)[(piece.color(), True)][1]
         bottom = \
-            [ deindexify(row + 2 * x, col + 2 * y) for (x, y) in down \
-             if (0 <= (row + 2 * x) < length) \
-                 and (0 <= (col + 2 * y) < length) \
-                 and board.is_free(row + 2 * x, col + 2 * y) \
-                 and (not board.is_free(row + x, col + y)) \
-                 and (board.get(row + x, col + y).color() != piece.color())]
+            [ deindexify(row_to, col_to) \
+             for ((row_over, col_over), (row_to, col_to)) \
+                 in jumps[row * length + col] \
+             if row_to > row \
+                 and board.is_free(row_to, col_to) \
+                 and (not board.is_free(row_over, col_over)) \
+                 and (board.get(row_over, col_over).color() != piece.color())]
         top = \
-            [ deindexify(row + 2 * x, col + 2 * y) for (x, y) in up \
-             if (0 <= (row + 2 * x) < length) \
-                 and (0 <= (col + 2 * y) < length) \
-                 and board.is_free(row + 2 * x, col + 2 * y) \
-                 and (not board.is_free(row + x, col + y)) \
-                 and (board.get(row + x, col + y).color() != piece.color())]
+            [ deindexify(row_to, col_to) \
+             for ((row_over, col_over), (row_to, col_to)) \
+                 in jumps[row * length + col] \
+             if row_to < row \
+                 and board.is_free(row_to, col_to) \
+                 and (not board.is_free(row_over, col_over)) \
+                 and (board.get(row_over, col_over).color() != piece.color())]
         return (sorted(bottom + top) if piece.is_king() else \
                 (sorted(bottom) if piece.is_black() else sorted(top))) \
                     if is_sorted else (bottom + top if piece.is_king() else \
@@ -145,42 +414,45 @@ def get_jumps(board, row, col, is_sorted = False):
 def search_path(board, row, col, path, paths, is_sorted = False):
     """
     This function recursive builds all capturing paths started at a certain
-    row/col position.
+    row/col position. The path is a stack shared by the whole search, only
+    the complete paths are copied into paths.
     """
     path.append( deindexify(row, col))
     jumps = get_jumps(board, row, col, is_sorted)
     if not jumps:
-        paths.append(path)
+        paths.append(list(path))
     else:
         for position in jumps:
             (row_to, col_to) =  indexify(position)
-            piece = copy.copy(board.get(row, col))
+            original = board.get(row, col)
+            piece = original
             board.remove(row, col)
-            board.place(row_to, col_to, piece)
             if (piece.color() == 'black' \
                 and row_to == board.get_length() - 1) \
                     or (piece.color() == 'white' \
                         and row_to == 0) \
                             and (not piece.is_king()):
-                                piece.turn_king()
+                                piece = piece.get_king()
+            board.place(row_to, col_to, piece)
             row_mid = row + 1 if row_to > row else row - 1
             col_mid = col + 1 if col_to > col else col - 1
             capture = board.get(row_mid, col_mid)
             board.remove(row_mid, col_mid)
-            search_path(board, row_to, col_to, copy.copy(path), paths)
+            search_path(board, row_to, col_to, path, paths)
             board.place(row_mid, col_mid, capture)
             board.remove(row_to, col_to)
-            board.place(row, col, piece)
+            board.place(row, col, original)
+    path.pop()
 
 def get_captures(board, row, col, is_sorted = False):
     """
     This function finds all capturing paths started at a certain row/col
     position on the board. If there is no capture from the given row/col,
-    this function will return an empty list [].
+    this function will return an empty list []. The board is left as it
+    was once the search returns, so it is searched in place.
     """
     paths = []
-    board_ = copy.copy(board)
-    search_path(board_, row, col, [], paths, is_sorted)
+    search_path(board, row, col, [], paths, is_sorted)
     if len(paths) == 1 and len(paths[0]) == 1:
         paths = []
     return paths
@@ -217,31 +489,35 @@ def initialize(board, b):
     for r in range(0, row):
         for c in range(0, col):
             if b[r][c] == 'w':
-                board.place(r, c, Piece('white'))
+                board.place(r, c, WHITE_PAWN)
             if b[r][c] == 'b':
-                board.place(r, c, Piece('black'))
+                board.place(r, c, BLACK_PAWN)
             if b[r][c] == 'W':
-                board.place(r, c, Piece('white', True))
+                board.place(r, c, WHITE_KING)
             if b[r][c] == 'B':
-                board.place(r, c, Piece('black', True))
+                board.place(r, c, BLACK_KING)
+
+def get_rows(board):
+    """
+    Returns the board as the list of strings read by initialize(), with '_'
+    for the empty squares.
+    """
+    length = board.get_length()
+    rows = []
+    for r in range(length):
+        pieces = [board.get(r, c) for c in range(length)]
+        rows.append(''.join(['_' if p is None else str(p) for p in pieces]))
+    return rows
 
 def count_pieces(board):
     """
-Counts the total number of black and white pieces on the board.
-    use two for loop and three if
-return tuple of black and white
+    Counts the total number of black and white pieces on the board, from
+    its evaluation terms: a BitBoard counts the bits of its masks instead
+    of scanning the board.
+    return tuple of black and white
     """
-    row = col = board.get_length()
-    black, white = 0, 0
-    for r in range(row):
-        for c in range(col):
-            piece = board.get(r, c)
-            if piece:
-                if piece.is_black():
-                    black += 1
-                if piece.is_white():
-                    white += 1
-    return (black, white)
+    (bp, bk, wp, wk) = board.get_evaluation_terms()[:4]
+    return (bp + bk, wp + wk)
 
 def get_all_moves(board, color, is_sorted = False):
     """
@@ -305,6 +581,219 @@ return tuple of move and jump
     else:
         return (move, jump)
 
+# The diagonal directions a piece can move or capture in, as (row, col)
+# steps: black pawns go down, white pawns go up and kings go both ways.
+KING_DIRECTIONS = [(+1, -1), (+1, +1), (-1, -1), (-1, +1)]
+BLACK_DIRECTIONS = KING_DIRECTIONS[:2]
+WHITE_DIRECTIONS = KING_DIRECTIONS[2:]
+
+def get_directions(color, is_king):
+    """
+    Returns the directions a piece of the given color and kind moves in.
+    """
+    if is_king:
+        return KING_DIRECTIONS
+    return BLACK_DIRECTIONS if color == 'black' else WHITE_DIRECTIONS
+
+# The lookup tables of the moves of each board size, by length, built on
+# first use by get_move_tables().
+move_tables = {}
+
+def get_move_tables(length):
+    """
+    Returns the lookup tables of the moves on a board of the given length,
+    as a dictionary mapping the (color, is_king) kind of a piece to a pair
+    (steps, jumps) of lists indexed by row * length + col: steps lists the
+    positions a piece of that kind on that square can move to, and jumps
+    the (over, landing) pairs of positions of its captures, both in the
+    order of get_directions() and inside the board.
+    """
+    tables = move_tables.get(length)
+    if tables is None:
+        tables = {}
+        for color in ('black', 'white'):
+            for is_king in (False, True):
+                steps, jumps = [], []
+                for row in range(length):
+                    for col in range(length):
+                        directions = get_directions(color, is_king)
+                        steps.append([(row + x, col + y) \
+                            for (x, y) in directions \
+                            if 0 <= row + x < length \
+                                and 0 <= col + y < length])
+                        jumps.append([((row + x, col + y), \
+                                       (row + 2 * x, col + 2 * y)) \
+                            for (x, y) in directions \
+                            if 0 <= row + 2 * x < length \
+                                and 0 <= col + 2 * y < length])
+                tables[(color, is_king)] = (steps, jumps)
+        move_tables[length] = tables
+    return tables
+
+def search_captures(board, row, col, color, is_king, path, paths):
+    """
+    Recursively extends the capture path of a piece of the given color and
+    kind standing (virtually) at row, col. The piece itself is not on the
+    board, and the captured pieces are removed while the path is extended
+    and put back afterwards. Complete paths are added to paths as tuples of
+    (row, col) positions.
+    """
+    length = board.get_length()
+    last = length - 1 if color == 'black' else 0
+    jumps = get_move_tables(length)[(color, is_king)][1]
+    extended = False
+    for ((row_over, col_over), (row_to, col_to)) in jumps[row * length + col]:
+        if board.is_free(row_to, col_to):
+            capture = board.get(row_over, col_over)
+            if capture is not None and capture.color() != color:
+                extended = True
+                board.remove(row_over, col_over)
+                path.append((row_to, col_to))
+                search_captures(board, row_to, col_to, color, \
+                                is_king or row_to == last, path, paths)
+                path.pop()
+                board.place(row_over, col_over, capture)
+    if not extended and len(path) > 1:
+        paths.append(tuple(path))
+
+def get_capture_paths(board, row, col):
+    """
+    Returns all the capture paths of the piece at row, col as tuples of
+    (row, col) positions, or an empty list. Like search_path(), a pawn
+    reaching the opponent's side is crowned and keeps capturing as a king,
+    and the starting square is free for the rest of the path.
+    """
+    piece = board.get(row, col)
+    if piece is not None and isinstance(board, BitBoard):
+        return get_capture_chains(board, piece.color(), \
+                                  BitBoard.bit(row, col))
+    paths = []
+    if piece is not None:
+        board.remove(row, col)
+        search_captures(board, row, col, piece.color(), piece.is_king(), \
+                        [(row, col)], paths)
+        board.place(row, col, piece)
+    return paths
+
+def get_capture_table(color, is_king, king_table = None):
+    """
+    Returns the captures of a piece of the given color and kind from each
+    dark square of a BitBoard, as lists of (over, landing, landing square,
+    table) tuples where over and landing are square masks and table is the
+    capture table the piece goes on with once landed: king_table for a pawn
+    crowned there, the returned table itself otherwise. The captures are in
+    the order of get_directions().
+    """
+    jumps = get_move_tables(8)[(color, is_king)][1]
+    last = 7 if color == 'black' else 0
+    table = [[] for square in SQUARE_POSITIONS]
+    for (square, (row, col)) in enumerate(SQUARE_POSITIONS):
+        for (over, landing) in jumps[row * 8 + col]:
+            crowned = not is_king and landing[0] == last
+            table[square].append((BitBoard.bit(*over), \
+                                  BitBoard.bit(*landing), \
+                                  landing[0] * 4 + landing[1] // 2, \
+                                  king_table if crowned else table))
+    return table
+
+def get_capture_tables():
+    """
+    Returns the get_capture_table() of each (color, is_king) kind of piece.
+    """
+    tables = {}
+    for color in ('black', 'white'):
+        tables[(color, True)] = get_capture_table(color, True)
+        tables[(color, False)] = \
+            get_capture_table(color, False, tables[(color, True)])
+    return tables
+
+CAPTURE_TABLES = get_capture_tables()
+
+def search_capture_chains(table, square, occupied, opponents, path, paths):
+    """
+    Extends the capture chain of a piece standing on the given square of a
+    BitBoard, whose captures are those of the given capture table, where
+    occupied is the mask of the other pieces and opponents that of the
+    pieces it can capture. A captured piece only leaves both masks, so the
+    board is left alone, and path is a single stack of (row, col) positions
+    shared by the whole search. The maximal chains are added to paths as
+    tuples, in the same order as search_captures().
+    """
+    extended = False
+    for (over, landing, to, next_table) in table[square]:
+        if opponents & over and not occupied & landing:
+            extended = True
+            path.append(SQUARE_POSITIONS[to])
+            search_capture_chains(next_table, to, occupied ^ over, \
+                                  opponents ^ over, path, paths)
+            path.pop()
+    if not extended and len(path) > 1:
+        paths.append(tuple(path))
+
+def get_capture_chains(board, color, mask = None):
+    """
+    Returns the capture paths of the pieces of the given color on a BitBoard
+    (only those of the pieces in mask if given) as get_capture_paths() and
+    in the order of get_positions(), but searched by
+    search_capture_chains() on the masks of the board.
+    """
+    (black_men, black_kings, white_men, white_kings) = board.get_masks()
+    occupied = black_men | black_kings | white_men | white_kings
+    if color == 'black':
+        pieces, kings = black_men | black_kings, black_kings
+        opponents = white_men | white_kings
+    else:
+        pieces, kings = white_men | white_kings, white_kings
+        opponents = black_men | black_kings
+    if mask is not None:
+        pieces &= mask
+    pawn_table = CAPTURE_TABLES[(color, False)]
+    king_table = CAPTURE_TABLES[(color, True)]
+    paths = []
+    path = [None]
+    while pieces:
+        bit = pieces & -pieces
+        pieces ^= bit
+        square = bit.bit_length() - 1
+        path[0] = SQUARE_POSITIONS[square]
+        search_capture_chains(king_table if kings & bit else pawn_table, \
+                              square, occupied ^ bit, opponents, path, paths)
+    return paths
+
+def is_capture(action):
+    """
+    Returns True if the action (a tuple of (row, col) positions) is a capture.
+    """
+    return abs(action[1][0] - action[0][0]) == 2
+
+def get_legal_moves(board, color):
+    """
+    Returns the legal moves of the given color as tuples of the (row, col)
+    positions visited, in the same order as get_hints(). The pieces of the
+    color are listed once: the capture paths are looked for first and the
+    quiet moves are only generated if there is no capture, since a capture
+    is mandatory. The capture paths of a BitBoard are searched on its masks
+    by get_capture_chains().
+    """
+    length = board.get_length()
+    if isinstance(board, BitBoard):
+        captures = get_capture_chains(board, color)
+    else:
+        captures = []
+        for (row, col) in board.get_positions(color):
+            captures.extend(get_capture_paths(board, row, col))
+    if captures:
+        return captures
+    tables = get_move_tables(length)
+    moves = []
+    for (row, col) in board.get_positions(color):
+        piece = board.get(row, col)
+        steps = tables[(color, piece.is_king())][0]
+        for (row_to, col_to) in steps[row * length + col]:
+            if board.is_free(row_to, col_to):
+                moves.append(((row, col), (row_to, col_to)))
+    return moves
+
 def apply_move(board, move):
     """
 Performs actual operations and moves that move the specified pieces.
@@ -328,7 +817,7 @@ No return
         piece = board.get(row, col)
         if piece.is_black() and row_end == board.get_length()-1 \
         or piece.is_white() and row_end == 0:
-            piece.turn_king()
+            piece = piece.get_king()
         board.remove(row, col)
         board.place(row_end, col_end, piece)
     else:
@@ -363,7 +852,7 @@ No return
             piece = board.get(row, col)
             if piece.is_black() and row_end == board.get_length()-1 \
             or piece.is_white() and row_end == 0:
-                piece.turn_king()
+                piece = piece.get_king()
             board.remove(row, col)
             row_eat, col_eat = max(row, row_end)-1, max(col, col_end)-1
             board.remove(row_eat, col_eat)
@@ -373,7 +862,16 @@ No return
                              + " \'hints\' to get suggestions.")
 
 
-def heuristics(state):
+def count_capture_squares(board, color):
+    """
+    Returns the total length of the capture paths of the given color.
+    """
+    if isinstance(board, BitBoard):
+        return sum([len(path) for path in get_capture_chains(board, color)])
+    return sum([len(path) for (row, col) in board.get_positions(color) \
+                    for path in get_capture_paths(board, row, col)])
+
+def heuristics(state, captures = None):
     """
     This is the heuristics function. This function calculates these metrics:
         a. Normalized utility values from the number of pawn and king pieces
@@ -384,40 +882,22 @@ def heuristics(state):
             kings. [0.70, -0.70]
         d. Normalized utility values from the number of pieces on the safer
             places on the board. [0.19, -0.19]
+    The counts and distances come from board.get_evaluation_terms(), which a
+    BitBoard keeps up to date as moves are made and unmade. Only the capture
+    paths are searched here. The optional captures dictionary maps a color
+    to the total length of its capture paths when the caller already knows
+    it (e.g. from the legal moves of the side to move), so they are not
+    searched again.
     """
     board = state[0]
     turn = state[1]
-    length = board.get_length()
-    bp, wp = 0, 0
-    bk, wk = 0, 0
-    bc, wc = 0, 0
-    bkd, wkd = 0, 0
-    bsd, wsd = 0.0, 0.0
-    for row in range(length):
-        for col in range(length):
-            piece = board.get(row, col)
-            if piece:
-                r = row if row > (length - (row + 1)) else (length - (row + 1))
-                c = col if col > (length - (col + 1)) else (length - (col + 1))
-                d = int(((r ** 2.0 + c ** 2.0) ** 0.5) / 2.0)
-                if piece.color() == 'black':
-                    bc += sum([len(v) for v in \
-                               get_captures(board, row, col)])
-                    if piece.is_king():
-                        bk += 1
-                    else:
-                        bp += 1
-                        bkd += row + 1
-                        bsd += d
-                else:
-                    wc += sum([len(v) for v in \
-                               get_captures(board, row, col)])
-                    if piece.is_king():
-                        wk += 1
-                    else:
-                        wp += 1
-                        wkd += length - (row + 1)
-                        wsd += d
+    (bp, bk, wp, wk, bkd, wkd, bsd, wsd) = board.get_evaluation_terms()
+    if captures is None:
+        captures = {}
+    bc = captures['black'] if 'black' in captures \
+        else count_capture_squares(board, 'black')
+    wc = captures['white'] if 'white' in captures \
+        else count_capture_squares(board, 'white')
     if turn == 'black':
         black_count_heuristics = \
                 3.125 * (((bp + bk * 2.0) - (wp + wk * 2.0)) \
@@ -437,6 +917,13 @@ def heuristics(state):
         return white_count_heuristics + white_capture_heuristics \
                     + white_kingdist_heuristics + white_safe_heuristics
 
+# The delta pruning of the quiescence search bounds the change of
+# heuristics() over a capture path by CAPTURE_VALUE, the material value of a
+# king, per piece captured, plus QUIESCENCE_MARGIN, the whole range of the
+# capture, crowning distance and safety terms.
+CAPTURE_VALUE = 12.5
+QUIESCENCE_MARGIN = 15.5
+
 def is_terminal(state, maxdepth = None):
     """
     Determines if a tree node is a terminal or not.
@@ -445,18 +932,16 @@ def is_terminal(state, maxdepth = None):
     board = state[0]
     turn = state[1]
     depth = state[2]
-    (moves, captures) = get_hints(board, turn)
-    if maxdepth is not None:
-        return ((not moves) and (not captures)) or depth >= maxdepth
-    else:
-        return ((not moves) and (not captures))
+    if maxdepth is not None and depth >= maxdepth:
+        return True
+    return not get_legal_moves(board, turn)
 
-def utility(state):
+def utility(state, captures = None):
     """
     This function computes the utility of a node, if that is
-    a terminal node.
+    a terminal node. See heuristics() for the captures argument.
     """
-    return heuristics(state)
+    return heuristics(state, captures)
 
 def transition(state, action, ttype):
     """
@@ -474,65 +959,457 @@ def transition(state, action, ttype):
     depth += 1
     return (board, turn, depth)
 
-def maxvalue(state, maxdepth, alpha = None, beta = None):
+def make_move(board, action):
+    """
+    Applies a move or a capture path to the board in place, without any
+    validity check, and returns the undo record needed by unmake_move().
+    The action is a tuple of (row, col) positions as given by
+    get_legal_moves(). The undo record holds
+    the start and end positions, the moving piece as it was before the move
+    and the list of captured (row, col, piece).
+    A pawn going through the opponent's side during the move is crowned.
+    """
+    (row, col) = action[0]
+    (row_end, col_end) = action[-1]
+    length = board.get_length()
+    piece = board.get(row, col)
+    crowned = piece.is_king()
+    captured = []
+    row_from, col_from = row, col
+    for (row_to, col_to) in action[1:]:
+        if abs(row_to - row_from) == 2:
+            row_mid, col_mid = (row_from + row_to) // 2, (col_from + col_to) // 2
+            captured.append((row_mid, col_mid, board.get(row_mid, col_mid)))
+            board.remove(row_mid, col_mid)
+        if (piece.is_black() and row_to == length - 1) \
+                or (piece.is_white() and row_to == 0):
+            crowned = True
+        row_from, col_from = row_to, col_to
+    board.remove(row, col)
+    board.place(row_end, col_end, piece.get_king() if crowned else piece)
+    return ((row, col), (row_end, col_end), piece, captured)
+
+def unmake_move(board, undo):
+    """
+    Restores the board as it was before the make_move() call that returned
+    the given undo record.
+    """
+    ((row, col), (row_end, col_end), piece, captured) = undo
+    board.remove(row_end, col_end)
+    board.place(row, col, piece)
+    for (row_mid, col_mid, capture) in captured:
+        board.place(row_mid, col_mid, capture)
+
+def transposition_key(board, turn, maximizer):
+    """
+    Returns the transposition table key of a node: the board hash completed
+    with the side to move and the maximizing side.
+    """
+    key = board.get_hash()
+    if turn == 'white':
+        key ^= ZOBRIST_WHITE_TURN
+    if maximizer == 'white':
+        key ^= ZOBRIST_WHITE_MAX
+    return key
+
+def probe_table(table, key, depth, alpha, beta, exact_depth = False, \
+                ply = 0):
+    """
+    Looks the node up in the transposition table. Returns the tuple
+    (value, move) where value is the stored value if it was searched at
+    least depth plies deep (exactly depth plies with exact_depth) and its
+    bound settles the node for the (alpha, beta) window, or None, and move
+    is the stored best move or None. The node is ply plies below the root,
+    see from_table_value().
+    """
+    entry = table.probe(key)
+    if entry is None:
+        return (None, None)
+    (bound, value, move) = (entry[2], from_table_value(entry[3], ply), \
+                            entry[4])
+    if entry[1] < depth or (exact_depth and entry[1] != depth):
+        return (None, move)
+    if bound == EXACT:
+        return (value, move)
+    if alpha is None or beta is None:
+        return (None, move)
+    if (bound == LOWER and value >= beta) \
+            or (bound == UPPER and value <= alpha):
+        return (value, move)
+    return (None, move)
+
+def store_table(table, key, depth, alpha, beta, value, move, ply = 0):
+    """
+    Stores the value of a node searched with the (alpha, beta) window, ply
+    plies below the root, see to_table_value().
+    """
+    if alpha is None or beta is None:
+        bound = EXACT
+    elif value <= alpha:
+        bound = UPPER
+    elif value >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    table.store(key, depth, bound, to_table_value(value, ply), move)
+
+def to_table_value(value, ply):
+    """
+    Returns the value of a node ply plies below the root as the
+    transposition table holds it. A tablebase win or loss is worth
+    TABLEBASE_WIN less the plies to the end of the game from the root, see
+    probe_tablebase(), so the table holds it less the plies from the node
+    instead: the entry then stays right in the searches of the next moves,
+    whose roots are deeper.
+    """
+    if value > TABLEBASE_BOUND:
+        return value + ply
+    if value < -TABLEBASE_BOUND:
+        return value - ply
+    return value
+
+def from_table_value(value, ply):
+    """
+    Returns the value of a node ply plies below the root from the value the
+    transposition table holds, see to_table_value().
+    """
+    if value > TABLEBASE_BOUND:
+        return value - ply
+    if value < -TABLEBASE_BOUND:
+        return value + ply
+    return value
+
+def get_epsilon(value):
+    """
+    Returns the width of a null window at the given value: the smallest
+    change of value the search tells apart.
+    """
+    return 1e-9 * max(1.0, abs(value))
+
+# The value of a win found in the endgame tablebase, well above any value
+# of heuristics(), less the plies from the root to the end of the game. The
+# values beyond TABLEBASE_BOUND are those of tablebase wins and losses.
+TABLEBASE_WIN = 1000.0
+TABLEBASE_BOUND = TABLEBASE_WIN / 2
+
+def get_tablebase():
+    """
+    Returns the tablebase.Tablebase of config.tablebase, or None.
+    """
+    if not config.tablebase:
+        return None
+    import tablebase
+    return tablebase.get_tablebase()
+
+def probe_tablebase(context, state, maximizer):
+    """
+    Returns the value of the node for maximizer from the tablebase of the
+    context, or None if the position has too many pieces for it: a win is
+    worth TABLEBASE_WIN less the plies to the end of the game from the root,
+    so the shortest win and the longest loss are preferred, and a draw its
+    utility(). The search ends at such a node either way.
+    """
+    (board, turn, depth) = state
+    tablebase = context.tablebase
+    if not isinstance(board, BitBoard) \
+            or sum(count_pieces(board)) > tablebase.get_max_pieces():
+        return None
+    entry = tablebase.probe(board, turn)
+    if entry is None:
+        return None
+    if context.stats is not None:
+        context.stats.tablebase_hits += 1
+    (result, distance) = entry
+    if result == 0:
+        return utility((board, maximizer, depth))
+    value = TABLEBASE_WIN - (depth + distance)
+    return value if (result > 0) == (turn == maximizer) else -value
+
+def order_moves(actions, first, context = None, ply = 0):
+    """
+    Returns the actions in the order they should be searched: the given one
+    (e.g. the best move of the transposition table) first, then the longest
+    capture paths, then the killer moves of the ply and then the quiet moves
+    by decreasing history score of the context.
+    """
+    if len(actions) < 2:
+        return actions
+    killers = context.killers[ply] \
+        if context is not None and ply < len(context.killers) else []
+    history = context.history if context is not None else {}
+    def score(a):
+        return (a == first, len(a), tuple(a) in killers, \
+                history.get((a[0], a[-1]), 0))
+    return sorted(actions, key = score, reverse = True)
+
+# The nodes of the alpha-beta search, maxvalue() and minvalue(), search
+# their children by making and unmaking each move on the same board. A node
+# is first looked up in the endgame tablebase of its context, valued by
+# probe_tablebase() without any search, and in its transposition table.
+# Its moves are then generated once for the terminal test, the expansion
+# and the evaluation, and searched in the order of order_moves(). With
+# config.principal_variation_search, the moves after the first one are only
+# searched with a null window, proving that they are not better, and
+# searched again with the whole window when this fails. With
+# config.quiescence_search, the nodes past the depth limit are searched by
+# quiescence_maxvalue() and quiescence_minvalue().
+
+def maxvalue(state, maxdepth, alpha = None, beta = None, context = None):
     """
     The maxvalue function for the adversarial tree search.
     """
     board = state[0]
     turn = state[1]
-    if is_terminal(state, maxdepth):
+    depth = state[2]
+    if context is None:
+        context = SearchContext()
+    if context.tablebase is not None:
+        v = probe_tablebase(context, state, turn)
+        if v is not None:
+            return v
+    if maxdepth is not None and depth >= maxdepth and config.quiescence_search:
+        return quiescence_maxvalue(state, alpha, beta, context)
+    context.visit()
+    stats = context.stats
+    if stats is not None:
+        stats.visit(depth)
+    if maxdepth is not None and depth >= maxdepth:
+        if stats is not None:
+            return stats.evaluate(state)
         return utility(state)
     else:
+        table = context.table
+        first = None
+        if maxdepth is not None:
+            key = transposition_key(board, turn, turn)
+            (v, first) = probe_table(table, key, maxdepth - depth, alpha, \
+                                     beta, context.exact_depth, depth)
+            if v is not None:
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return v
+        alpha_, beta_ = alpha, beta
         v = float('-inf')
-        (moves, captures) = get_hints(board, turn)
-        if captures:
-            for a in captures:
-                v = max(v, minvalue(transition(state, a, "jump"), \
-                        maxdepth, alpha, beta))
-                if alpha is not None and beta is not None:
-                    if v >= beta:
-                        return v
-                    alpha = max(alpha, v)
-            return v
-        elif moves:
-            for a in moves:
-                v = max(v, minvalue(transition(state, a, "move"), \
-                        maxdepth, alpha, beta))
-                if alpha is not None and beta is not None:
-                    if v >= beta:
-                        return v
-                    alpha = max(alpha, v)
-            return v
+        best = None
+        if stats is None:
+            actions = get_legal_moves(board, turn)
+        else:
+            actions = stats.timed('movegen', get_legal_moves, board, turn)
+        if not actions:
+            # a node without any move has no capture to evaluate either
+            if stats is not None:
+                return stats.evaluate(state, {turn: 0})
+            return utility(state, {turn: 0})
+        child = (board, 'white' if turn == 'black' else 'black', depth + 1)
+        pvs = alpha is not None and beta is not None \
+            and config.principal_variation_search
+        for (i, a) in enumerate(order_moves(actions, first, context, depth)):
+            if stats is None:
+                undo = make_move(board, a)
+            else:
+                undo = stats.timed('make', make_move, board, a)
+            if i == 0 or not pvs:
+                value = minvalue(child, maxdepth, alpha, beta, context)
+            else:
+                value = minvalue(child, maxdepth, alpha, \
+                                 alpha + get_epsilon(alpha), context)
+                if alpha < value < beta:
+                    if stats is not None:
+                        stats.researches += 1
+                    value = minvalue(child, maxdepth, alpha, beta, context)
+            if stats is None:
+                unmake_move(board, undo)
+            else:
+                stats.timed('make', unmake_move, board, undo)
+            if value > v:
+                v, best = value, a
+            if alpha is not None and beta is not None:
+                if v >= beta:
+                    if not is_capture(a) and maxdepth is not None:
+                        context.cutoff(a, depth, maxdepth - depth)
+                    if stats is not None:
+                        stats.cutoff(depth, i)
+                    break
+                alpha = max(alpha, v)
+        if maxdepth is not None:
+            store_table(table, key, maxdepth - depth, alpha_, beta_, v, \
+                        best, depth)
+        return v
 
-def minvalue(state, maxdepth, alpha = None, beta = None):
+def minvalue(state, maxdepth, alpha = None, beta = None, context = None):
     """
-    The minvalue function for the adversarial tree search.
+    The minvalue function for the adversarial tree search. Terminal nodes
+    are evaluated for the maximizing side, i.e. the opponent of turn.
     """
     board = state[0]
     turn = state[1]
-    if is_terminal(state, maxdepth):
-        return utility(state)
+    depth = state[2]
+    opponent = 'white' if turn == 'black' else 'black'
+    if context is None:
+        context = SearchContext()
+    if context.tablebase is not None:
+        v = probe_tablebase(context, state, opponent)
+        if v is not None:
+            return v
+    if maxdepth is not None and depth >= maxdepth and config.quiescence_search:
+        return quiescence_minvalue(state, alpha, beta, context)
+    context.visit()
+    stats = context.stats
+    if stats is not None:
+        stats.visit(depth)
+    if maxdepth is not None and depth >= maxdepth:
+        if stats is not None:
+            return stats.evaluate((board, opponent, depth))
+        return utility((board, opponent, depth))
     else:
+        table = context.table
+        first = None
+        if maxdepth is not None:
+            key = transposition_key(board, turn, opponent)
+            (v, first) = probe_table(table, key, maxdepth - depth, alpha, \
+                                     beta, context.exact_depth, depth)
+            if v is not None:
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return v
+        alpha_, beta_ = alpha, beta
         v = float('inf')
-        (moves, captures) = get_hints(board, turn)
-        if captures:
-            for a in captures:
-                v = min(v, maxvalue(transition(state, a, "jump"), \
-                                     maxdepth, alpha, beta))
-                if alpha is not None and beta is not None:
-                    if v <= alpha:
-                        return v
-                    beta = min(beta, v)
-            return v
-        elif moves:
-            for a in moves:
-                v = min(v, maxvalue(transition(state, a, "move"), \
-                                     maxdepth, alpha, beta))
-                if alpha is not None and beta is not None:
-                    if v <= alpha:
-                        return v
-                    beta = min(beta, v)
-            return v
+        best = None
+        if stats is None:
+            actions = get_legal_moves(board, turn)
+        else:
+            actions = stats.timed('movegen', get_legal_moves, board, turn)
+        if not actions:
+            # a node without any move has no capture to evaluate either
+            if stats is not None:
+                return stats.evaluate((board, opponent, depth), {turn: 0})
+            return utility((board, opponent, depth), {turn: 0})
+        child = (board, opponent, depth + 1)
+        pvs = alpha is not None and beta is not None \
+            and config.principal_variation_search
+        for (i, a) in enumerate(order_moves(actions, first, context, depth)):
+            if stats is None:
+                undo = make_move(board, a)
+            else:
+                undo = stats.timed('make', make_move, board, a)
+            if i == 0 or not pvs:
+                value = maxvalue(child, maxdepth, alpha, beta, context)
+            else:
+                value = maxvalue(child, maxdepth, beta - get_epsilon(beta), \
+                                 beta, context)
+                if alpha < value < beta:
+                    if stats is not None:
+                        stats.researches += 1
+                    value = maxvalue(child, maxdepth, alpha, beta, context)
+            if stats is None:
+                unmake_move(board, undo)
+            else:
+                stats.timed('make', unmake_move, board, undo)
+            if value < v:
+                v, best = value, a
+            if alpha is not None and beta is not None:
+                if v <= alpha:
+                    if not is_capture(a) and maxdepth is not None:
+                        context.cutoff(a, depth, maxdepth - depth)
+                    if stats is not None:
+                        stats.cutoff(depth, i)
+                    break
+                beta = min(beta, v)
+        if maxdepth is not None:
+            store_table(table, key, maxdepth - depth, alpha_, beta_, v, \
+                        best, depth)
+        return v
+
+# The quiescence search of the nodes past the depth limit only searches the
+# capture paths, until a position without any capture for the side to move,
+# whose heuristics() is the stand-pat value. A capture being mandatory, the
+# side to move cannot stand pat while it has one, so the stand-pat value of
+# such a node only serves the delta pruning: the node fails without
+# searching its captures if even its longest one cannot bring the value
+# back inside the window.
+
+def quiescence_maxvalue(state, alpha = None, beta = None, context = None):
+    """
+    The quiescence search of a maxvalue node past the depth limit.
+    """
+    board = state[0]
+    turn = state[1]
+    depth = state[2]
+    context.visit()
+    stats = context.stats
+    if stats is not None:
+        stats.visit(depth)
+        actions = stats.timed('movegen', get_legal_moves, board, turn)
+    else:
+        actions = get_legal_moves(board, turn)
+    if not actions or not is_capture(actions[0]):
+        if stats is not None:
+            return stats.evaluate(state, {turn: 0})
+        return utility(state, {turn: 0})
+    if alpha is not None:
+        captures = {turn: sum([len(a) for a in actions])}
+        if stats is not None:
+            stand_pat = stats.evaluate(state, captures)
+        else:
+            stand_pat = utility(state, captures)
+        delta = CAPTURE_VALUE * (max([len(a) for a in actions]) - 1) \
+            + QUIESCENCE_MARGIN
+        if stand_pat + delta <= alpha:
+            return stand_pat + delta
+    v = float('-inf')
+    child = (board, 'white' if turn == 'black' else 'black', depth + 1)
+    for a in order_moves(actions, None):
+        undo = make_move(board, a)
+        value = quiescence_minvalue(child, alpha, beta, context)
+        unmake_move(board, undo)
+        v = max(v, value)
+        if alpha is not None and beta is not None:
+            if v >= beta:
+                break
+            alpha = max(alpha, v)
+    return v
+
+def quiescence_minvalue(state, alpha = None, beta = None, context = None):
+    """
+    The quiescence search of a minvalue node past the depth limit.
+    """
+    board = state[0]
+    turn = state[1]
+    depth = state[2]
+    opponent = 'white' if turn == 'black' else 'black'
+    context.visit()
+    stats = context.stats
+    if stats is not None:
+        stats.visit(depth)
+        actions = stats.timed('movegen', get_legal_moves, board, turn)
+    else:
+        actions = get_legal_moves(board, turn)
+    if not actions or not is_capture(actions[0]):
+        if stats is not None:
+            return stats.evaluate((board, opponent, depth), {turn: 0})
+        return utility((board, opponent, depth), {turn: 0})
+    if beta is not None:
+        captures = {turn: sum([len(a) for a in actions])}
+        if stats is not None:
+            stand_pat = stats.evaluate((board, opponent, depth), captures)
+        else:
+            stand_pat = utility((board, opponent, depth), captures)
+        delta = CAPTURE_VALUE * (max([len(a) for a in actions]) - 1) \
+            + QUIESCENCE_MARGIN
+        if stand_pat - delta >= beta:
+            return stand_pat - delta
+    v = float('inf')
+    child = (board, opponent, depth + 1)
+    for a in order_moves(actions, None):
+        undo = make_move(board, a)
+        value = quiescence_maxvalue(child, alpha, beta, context)
+        unmake_move(board, undo)
+        v = min(v, value)
+        if alpha is not None and beta is not None:
+            if v <= alpha:
+                break
+            beta = min(beta, v)
+    return v
 
 def minimax_search(state, maxdepth = None):
     """
@@ -550,36 +1427,482 @@ def minimax_search(state, maxdepth = None):
     else:
         return ("pass", -1)
 
-def alphabeta_search(state, maxdepth = None):
+def alphabeta_search(state, maxdepth = None, context = None, first = None, \
+                     window = None):
     """
     The depth limited alpha-beta tree search, it's 2-times faster than
-    the minimax search.
+    the minimax search. The whole tree is searched on the given board,
+    which is left unchanged once the search returns. The transposition
+    table of the context is shared by the whole search and kept for the
+    next ones. The root moves are searched in the order of order_moves(),
+    starting with first if given, but ties between equal values are still
+    broken by the order of get_legal_moves().
+    With config.principal_variation_search, the moves after the first one
+    are searched with a null window at the best value, just below it for
+    a move winning the ties, and only searched again when they beat it.
+    The search can be given an aspiration window (alpha, beta): it then
+    returns as soon as a move reaches beta, and a value outside of the
+    window is only a bound, which the caller has to search again with a
+    wider window.
     """
     board = state[0]
     turn = state[1]
-    (moves, captures) = get_hints(board, turn)
-    alpha = float('-inf')
-    beta = float('inf')
-    if captures:
-        return max([\
-            (a, minvalue(transition(state, a, "jump"), \
-                         maxdepth, alpha, beta)) \
-                             for a in captures], key = lambda v: v[1])
-    elif moves:
-        return max([\
-            (a, minvalue(transition(state, a, "move"), \
-                         maxdepth, alpha, beta)) \
-                             for a in moves], key = lambda v: v[1])
+    depth = state[2]
+    if context is None:
+        context = SearchContext()
+    context.table.new_search()
+    actions = get_legal_moves(board, turn)
+    (alpha, beta) = window if window is not None \
+        else (float('-inf'), float('inf'))
+    pvs = maxdepth is not None and config.principal_variation_search
+    child = (board, 'white' if turn == 'black' else 'black', depth + 1)
+    best = None
+    for a in order_moves(actions, first, context, depth):
+        undo = make_move(board, a)
+        if best is None or not pvs:
+            value = minvalue(child, maxdepth, alpha, beta, context)
+        else:
+            bound = best[1]
+            if actions.index(a) < actions.index(best[0]):
+                bound -= get_epsilon(bound)
+            bound = max(bound, alpha)
+            value = minvalue(child, maxdepth, bound, \
+                             bound + get_epsilon(bound), context)
+            if bound < value < beta:
+                if context.stats is not None:
+                    context.stats.researches += 1
+                value = minvalue(child, maxdepth, bound, beta, context)
+        unmake_move(board, undo)
+        if best is None or (value, -actions.index(a)) \
+                > (best[1], -actions.index(best[0])):
+            best = (a, value)
+        if value >= beta:
+            break
+    if context.stats is not None and maxdepth is not None:
+        context.stats.depth = maxdepth - depth
+    if best is not None:
+        return best
     else:
         return ("pass", -1)
 
+# The process pool of the parallel root search and its number of workers,
+# created on first use and kept for the next searches.
+search_pool = None
+search_pool_workers = 0
+
+def get_search_pool(workers):
+    """
+    Returns the process pool of the parallel root search, (re)created if it
+    does not have the given number of workers.
+    """
+    global search_pool, search_pool_workers
+    if search_pool is None or search_pool_workers != workers:
+        if search_pool is not None:
+            search_pool.shutdown()
+        search_pool = concurrent.futures.ProcessPoolExecutor(workers)
+        search_pool_workers = workers
+    return search_pool
+
+# The process pools of get_game_pool(), of a single worker each, created on
+# first use and kept for the next games.
+game_pools = []
+
+def get_game_pool(id, workers):
+    """
+    Returns the process pool playing the moves of the game with the given
+    id, one of workers pools of a single process: every move of a game is
+    then searched by the same process, which keeps the Engine of the game
+    from one move to the next (see engine_move()). The pools are (re)created
+    if there are not workers of them.
+    """
+    global game_pools
+    if len(game_pools) != workers:
+        for pool in game_pools:
+            pool.shutdown()
+        game_pools = [concurrent.futures.ProcessPoolExecutor(1) \
+                      for i in range(workers)]
+    return game_pools[hash(id) % workers]
+
+def search_root_move(board, turn, action, maxdepth, alpha, deadline):
+    """
+    Searches a single root move with the (alpha, inf) window in a worker
+    process of the parallel root search. The worker keeps its own
+    transposition table from one task to the next, but only uses the values
+    searched at the exact depth asked for, so the value does not depend on
+    which tasks the worker ran before.
+    """
+    context = SearchContext(deadline = deadline, exact_depth = True)
+    make_move(board, action)
+    child = (board, 'white' if turn == 'black' else 'black', 1)
+    return minvalue(child, maxdepth, alpha, float('inf'), context)
+
+def parallel_alphabeta_search(state, maxdepth, workers, context = None, \
+                              first = None):
+    """
+    The alpha-beta search with its root moves spread over a pool of worker
+    processes. Moves are handed out in the order of order_moves() as the
+    workers become free, each with the best value known so far as alpha.
+    The alpha given is kept just below that value: a move as good as the
+    best one gets its exact value and ties are broken by the order of
+    get_legal_moves() as in alphabeta_search(), so the result does not
+    depend on the order the workers finish in.
+    A SearchTimeout raised by a worker is raised again once the pending
+    moves are cancelled.
+    """
+    board = state[0]
+    turn = state[1]
+    if context is None:
+        context = SearchContext()
+    actions = get_legal_moves(board, turn)
+    if not actions:
+        return ("pass", -1)
+    pool = get_search_pool(workers)
+    pending = list(order_moves(actions, first, context, state[2]))
+    running = {}
+    results = []
+    alpha = float('-inf')
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                a = pending.pop(0)
+                bound = alpha - get_epsilon(alpha)
+                future = pool.submit(search_root_move, board, turn, a, \
+                                     maxdepth - state[2], bound, \
+                                     context.deadline)
+                running[future] = a
+            done, _ = concurrent.futures.wait(running, \
+                return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                a = running.pop(future)
+                value = future.result()
+                results.append((a, value))
+                alpha = max(alpha, value)
+    finally:
+        for future in running:
+            future.cancel()
+    return max(results, key = lambda v: (v[1], -actions.index(v[0])))
+
+def iterative_deepening_search(state, budget, maxdepth = None, table = None, \
+                               workers = 1, stats = None, context = None, \
+                               start = 1, first = None):
+    """
+    Runs alpha-beta searches of depth 1, 2, 3... until the time budget (in
+    seconds) is spent or maxdepth is reached. Returns the tuple
+    (move, value, depth) of the last completed depth. Each iteration searches
+    the best move of the previous one first, and the transposition table
+    orders the rest of its principal variation. The killer moves and the
+    history scores are kept from one iteration to the next.
+    The search works on a copy of the board since an interrupted search
+    does not unmake its moves. With more than 1 worker, each iteration is a
+    parallel_alphabeta_search(). Otherwise each iteration is first searched
+    within config.aspiration_window of the value of the previous one, and
+    searched again with the whole window if its value falls outside.
+    The search fills in the SearchStats given as stats, if any, where only
+    the nodes of this process are counted.
+    An Engine passes its own context, whose killer moves and history are
+    then kept for its next searches, and may start deeper than depth 1,
+    searching first its move first, when it expected the position.
+    The first iteration only ignores the deadline at depth 1: a deeper one
+    abandoned at the deadline is replaced by a search of depth 1.
+    """
+    deadline = time.time() + budget
+    root = state[0]
+    board = copy.deepcopy(root)
+    actions = get_legal_moves(board, state[1])
+    if len(actions) == 1:
+        return (actions[0], 0, 0)
+    state = (board, state[1], state[2])
+    if context is None:
+        context = SearchContext(table, stats = stats)
+    else:
+        context.deadline, context.stats = None, stats
+    if stats is not None:
+        stats.start(context)
+    depth = start if maxdepth is None else max(1, min(start, maxdepth))
+    if first not in actions:
+        first = None
+    best = None
+    if depth > 1:
+        context.deadline = deadline
+        try:
+            best = alphabeta_search(state, state[2] + depth, context, first)
+        except SearchTimeout:
+            depth = 1
+            state = (copy.deepcopy(root), state[1], state[2])
+        context.deadline = None
+    if best is None:
+        best = alphabeta_search(state, state[2] + depth, context, first)
+    context.deadline = deadline
+    while best[0] != "pass" and (maxdepth is None or depth < maxdepth) \
+            and time.time() < deadline:
+        try:
+            if workers > 1:
+                result = parallel_alphabeta_search(state, \
+                    state[2] + depth + 1, workers, context, best[0])
+            elif config.aspiration_window > 0:
+                window = (best[1] - config.aspiration_window, \
+                          best[1] + config.aspiration_window)
+                result = alphabeta_search(state, state[2] + depth + 1, \
+                                          context, best[0], window)
+                if not window[0] < result[1] < window[1]:
+                    result = alphabeta_search(state, state[2] + depth + 1, \
+                                              context, best[0])
+            else:
+                result = alphabeta_search(state, state[2] + depth + 1, \
+                                          context, best[0])
+        except SearchTimeout:
+            break
+        depth += 1
+        best = result
+    if stats is not None:
+        stats.depth = depth
+        stats.stop(context)
+    return (best[0], best[1], depth)
+
+class PonderContext(SearchContext):
+    """
+    The search context of a ponder search, sharing the table and the history
+    scores of the context of an Engine: the search is also abandoned once
+    stop() is called from another thread. It starts with the killer moves
+    of the context 2 plies up, since it searches 2 plies below its root.
+    """
+
+    def __init__(self, context):
+        SearchContext.__init__(self, context.table)
+        self.killers = [list(killers) for killers in context.killers[2:]]
+        self.history = context.history
+        self.stopped = False
+
+    def stop(self):
+        """
+        Makes the search raise SearchTimeout at its next clock check.
+        """
+        self.stopped = True
+
+    def is_stopped(self):
+        """
+        Returns True once stop() was called.
+        """
+        return self.stopped
+
+class Engine(object):
+    """
+    The search state kept from one move to the next of a game: the
+    transposition table (transposition_table by default), the search
+    context with its killer moves and history scores, and the position
+    expected at the next move, i.e. after the move played and the reply the
+    last search expects. When the opponent plays that reply, the search
+    starts 2 plies shallower than the last one instead of depth 1, since
+    the table holds the subtree searched for it. A board with more pieces
+    than the last one starts a new game.
+    The move of a position of the opening book of config.opening_book (see
+    book.py) is played without any search.
+    With config.ponder, the expected position is searched in a background
+    thread from the end of a search to the start of the next one, i.e.
+    while the opponent thinks. The next search goes on from the depth the
+    ponder search completed if the opponent played the expected reply, and
+    only stops it otherwise.
+    """
+
+    def __init__(self, table = None):
+        self.table = table if table is not None else transposition_table
+        self.context = SearchContext(self.table)
+        self.prediction = None
+        self.pieces = 0
+        self.hits = 0
+        self.misses = 0
+        self.pondering = None
+        self.ponder_hits = 0
+
+    def new_game(self):
+        """
+        Forgets the search state of the previous game.
+        """
+        self.stop_pondering()
+        self.table.clear()
+        self.context = SearchContext(self.table)
+        self.prediction = None
+        self.hits = 0
+        self.misses = 0
+        self.ponder_hits = 0
+
+    def age(self, killers = None):
+        """
+        Moves the killer moves of the context 2 plies up, to the plies of
+        the next search, or replaces them by the given ones, and halves the
+        history scores.
+        """
+        if killers is None:
+            del self.context.killers[:2]
+        else:
+            self.context.killers = killers
+        history = self.context.history
+        for key in list(history):
+            history[key] //= 2
+            if not history[key]:
+                del history[key]
+
+    def predict(self, board, turn, move, depth):
+        """
+        Records the position expected at the next move: the board after the
+        move of the given turn and the reply found in the table, with the
+        depth left to search below it and the move the table holds for it.
+        """
+        self.prediction = None
+        opponent = 'white' if turn == 'black' else 'black'
+        board = copy.deepcopy(board)
+        make_move(board, move)
+        entry = self.table.probe(transposition_key(board, opponent, turn))
+        if entry is None or entry[4] is None \
+                or entry[4] not in get_legal_moves(board, opponent):
+            return
+        make_move(board, entry[4])
+        key = transposition_key(board, turn, turn)
+        entry = self.table.probe(key)
+        self.prediction = (key, depth - 2, \
+                           entry[4] if entry is not None else None, board)
+
+    def ponder(self, turn):
+        """
+        Starts searching the expected position, where turn is to move, in a
+        background thread, for at most config.ponder_time_budget seconds.
+        """
+        if self.prediction is None:
+            return
+        (key, depth, first, board) = self.prediction
+        context = PonderContext(self.context)
+        result = []
+        def search():
+            try:
+                result.append(iterative_deepening_search((board, turn, 0), \
+                    config.ponder_time_budget, config.search_max_depth, \
+                    context = context, first = first))
+            except SearchTimeout:
+                pass
+        thread = threading.Thread(target = search, name = "ponder")
+        thread.daemon = True
+        self.pondering = (key, context, thread, result)
+        thread.start()
+
+    def stop_pondering(self):
+        """
+        Stops the ponder search, if any, and returns the tuple (key, context,
+        (move, value, depth)) of its position, context and result, or None
+        if it did not complete its first iteration.
+        """
+        if self.pondering is None:
+            return None
+        (key, context, thread, result) = self.pondering
+        self.pondering = None
+        context.stop()
+        thread.join()
+        return (key, context, result[0]) if result else None
+
+    def get_next_move(self, board, turn, stats = None):
+        """
+        Searches the move to play on the board as get_next_move(), reusing
+        the state of the previous searches, and returns the tuple
+        (move, value, depth) of the search.
+        """
+        pondered = self.stop_pondering()
+        (bp, bk, wp, wk) = board.get_evaluation_terms()[:4]
+        if bp + bk + wp + wk > self.pieces:
+            self.new_game()
+            pondered = None
+        self.pieces = bp + bk + wp + wk
+        if config.opening_book:
+            import book
+            entry = book.probe(board, turn)
+            if entry is not None and entry[0] in get_legal_moves(board, turn):
+                self.prediction = None
+                return entry
+        start, first, killers = 1, None, None
+        key = transposition_key(board, turn, turn)
+        if self.prediction is not None and self.prediction[0] == key:
+            self.hits += 1
+            start, first = max(1, self.prediction[1]), self.prediction[2]
+        elif self.prediction is not None:
+            self.misses += 1
+        if pondered is not None and pondered[0] == key:
+            self.ponder_hits += 1
+            (context, (move, value, depth)) = pondered[1:]
+            if move != "pass":
+                start, first = max(start, depth), move
+            killers = context.killers
+        self.age(killers)
+        state = (board, turn, 0)
+        if config.lazy_smp and config.search_workers > 1:
+            import smp
+            move = smp.lazy_smp_search(state, config.search_time_budget, \
+                                       config.search_max_depth)
+        else:
+            move = iterative_deepening_search(state, \
+                config.search_time_budget, config.search_max_depth, \
+                workers = config.search_workers, stats = stats, \
+                context = self.context, start = start, first = first)
+        if move[0] != "pass":
+            self.predict(board, turn, move[0], move[2])
+            if config.ponder and config.search_workers == 1:
+                self.ponder(turn)
+        return move
+
+# The engine of the games played by play().
+engine = Engine()
+
 def get_next_move(board, turn):
     """
     Use the AI to get the next best move.
-    Takes almost 6 seconds to find a move.
+    The search is deepened until config.search_time_budget seconds are
+    spent or config.search_max_depth is reached, over config.search_workers
+    processes which either split the root moves or, with config.lazy_smp,
+    run a Lazy SMP search (see smp.py). The search state is kept from one
+    move to the next by engine.
+    With config.search_stats, the SearchStats of the search are kept in
+    last_search_stats and printed as JSON (the Lazy SMP search has none).
     """
-    state = (board, turn, 0)
+    global last_search_stats
     print("Thinking ...")
-    #move = minimax_search(state, 6) # slow
-    move = alphabeta_search(state, 6) # fast
+    #move = minimax_search((board, turn, 0), 6) # slow
+    stats = SearchStats() \
+        if config.search_stats and not \
+            (config.lazy_smp and config.search_workers > 1) else None
+    move = engine.get_next_move(board, turn, stats)
+    last_search_stats = stats
+    if stats is not None:
+        print("Search stats: %s" \
+              % json.dumps(stats.as_dict(), sort_keys = True))
     return move[0]
+
+# The largest number of games whose engine a process keeps, see engines.
+MAX_ENGINES = 8
+
+# The engines of the games played by engine_move() in a process, by game id,
+# the least recently used first. A process is never told that a game ended,
+# so it only keeps the engines of the last MAX_ENGINES games it played in.
+engines = collections.OrderedDict()
+
+def engine_move(id, board, color, budget = None):
+    """
+    Returns the move that the engine of the game with the given id plays
+    with color on the board (a list of strings), as play() does, after
+    thinking for budget seconds (config.search_time_budget by default). It
+    is meant to run in the process of get_game_pool(id, workers), so that
+    each game keeps its own Engine. The budget is passed along since such a
+    process does not see the config of its parent unless it was forked.
+    """
+    if id in engines:
+        engines.move_to_end(id)
+    else:
+        engines[id] = Engine(TranspositionTable())
+        if len(engines) > MAX_ENGINES:
+            engines.popitem(last = False)[1].stop_pondering()
+    b = BitBoard(len(board))
+    initialize(b, board)
+    turn = 'black' if color == 'b' else 'white'
+    previous = config.search_time_budget
+    if budget is not None:
+        config.search_time_budget = budget
+    try:
+        return list(engines[id].get_next_move(b, turn)[0])
+    finally:
+        config.search_time_budget = previous
@@ -0,0 +1,305 @@
+import io
+import sys
+import json
+import time
+import argparse
+import cProfile
+import pstats
+import contextlib
+
+import ai
+import config
+from checkers import BitBoard
+from checkers import START_POSITION
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is then not reported
+    resource = None
+
+# Version of the JSON report, to be bumped when its layout changes.
+REPORT_VERSION = 1
+
+# Timings shorter than this (in seconds) are too noisy to be compared.
+MIN_SECONDS = 0.05
+
+# The benchmark positions: the standard start position and tactical ones
+# with long capture chains and kings, as (board, color to play).
+POSITIONS = {
+    'start': (START_POSITION, 'b'),
+    'middle': (['_b_b_b_b',
+                'b_b___b_',
+                '___b_b_b',
+                '__b_____',
+                '_w___w__',
+                'w___w___',
+                '_w_w_w_w',
+                'w_w_w_w_'], 'w'),
+    'combo': (['________',
+               'b___b___',
+               '_w_w_w__',
+               '________',
+               '_w_w_W__',
+               '________',
+               '_W_w____',
+               '____B___'], 'b'),
+    'kings': (['_____W__',
+               '____b_b_',
+               '________',
+               '__B___w_',
+               '________',
+               '__b_____',
+               '________',
+               '________'], 'w'),
+    'endgame': (['________',
+                 '__B_____',
+                 '________',
+                 '____w___',
+                 '_____W__',
+                 '__b_____',
+                 '___w____',
+                 '________'], 'b'),
+}
+
+# The settings of bench_play(): the search runs in this process only, never
+# ponders, and uses neither the opening book nor the endgame tablebase.
+PLAY_SETTINGS = {'ponder': False, 'search_workers': 1, 'lazy_smp': False, \
+                 'opening_book': None, 'tablebase': None}
+
+def make_state(name):
+    """
+    Returns the search state (board, turn, depth) of a benchmark position.
+    """
+    (rows, color) = POSITIONS[name]
+    board = BitBoard()
+    ai.initialize(board, rows)
+    return (board, 'black' if color == 'b' else 'white', 0)
+
+def perft(board, turn, depth):
+    """
+    Counts the leaf nodes of the move tree of the given depth, a whole
+    capture path counting as a single move.
+    """
+    if depth == 0:
+        return 1
+    actions = ai.get_legal_moves(board, turn)
+    if depth == 1:
+        return len(actions)
+    opponent = 'white' if turn == 'black' else 'black'
+    nodes = 0
+    for a in actions:
+        undo = ai.make_move(board, a)
+        nodes += perft(board, opponent, depth - 1)
+        ai.unmake_move(board, undo)
+    return nodes
+
+def bench_perft(depth):
+    """
+    Returns the perft counts of every position, for the depths 1 to depth.
+    """
+    report = {}
+    for name in sorted(POSITIONS):
+        (board, turn, _) = make_state(name)
+        report[name] = dict([(str(d), perft(board, turn, d)) \
+                             for d in range(1, depth + 1)])
+    return report
+
+def bench_search(depth):
+    """
+    Runs an alpha-beta search of the given depth on every position, with an
+    empty transposition table and without the endgame tablebase, and
+    returns its nodes, time and result.
+    """
+    report = {}
+    tablebase = config.tablebase
+    config.tablebase = None
+    try:
+        for name in sorted(POSITIONS):
+            state = make_state(name)
+            context = ai.SearchContext(ai.TranspositionTable())
+            start = time.time()
+            (move, value) = ai.alphabeta_search(state, depth, context)
+            seconds = time.time() - start
+            report[name] = {
+                'depth': depth,
+                'nodes': context.nodes,
+                'seconds': round(seconds, 4),
+                'nps': int(context.nodes / seconds) if seconds > 0 else 0,
+                'move': [list(p) for p in move],
+                'value': round(value, 6),
+            }
+    finally:
+        config.tablebase = tablebase
+    return report
+
+def bench_pvs(depth):
+    """
+    Runs the searches of bench_search() both with and without the principal
+    variation search, and returns their moves and node counts.
+    """
+    pvs = config.principal_variation_search
+    try:
+        config.principal_variation_search = False
+        plain = bench_search(depth)
+        config.principal_variation_search = True
+        report = bench_search(depth)
+    finally:
+        config.principal_variation_search = pvs
+    return dict([(name, {'depth': depth,
+                         'move': report[name]['move'],
+                         'nodes': report[name]['nodes'],
+                         'plain_move': plain[name]['move'],
+                         'plain_nodes': plain[name]['nodes']}) \
+                 for name in report])
+
+def bench_play(depth):
+    """
+    Times ai.play() on every position, with the search limited to the given
+    depth instead of the time budget of the configuration, and with the
+    settings of PLAY_SETTINGS.
+    """
+    report = {}
+    settings = dict(PLAY_SETTINGS, search_time_budget = float('inf'), \
+                    search_max_depth = depth)
+    previous = dict([(name, getattr(config, name)) for name in settings])
+    for (name, value) in settings.items():
+        setattr(config, name, value)
+    try:
+        for name in sorted(POSITIONS):
+            (rows, color) = POSITIONS[name]
+            ai.engine.new_game()
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ai.play(rows, color)
+            report[name] = round(time.time() - start, 4)
+    finally:
+        ai.engine.stop_pondering()
+        for (name, value) in previous.items():
+            setattr(config, name, value)
+    return report
+
+def bench_profile(depth, count = 20):
+    """
+    Profiles the searches of bench_search() and returns the time spent in
+    the count most expensive functions, excluding their callees. The
+    functions are named file(function), without their line numbers, so the
+    reports can be compared once the code moved; the functions of a file
+    sharing a name are counted together.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    bench_search(depth)
+    profiler.disable()
+    functions = {}
+    for (f, s) in pstats.Stats(profiler).stats.items():
+        name = "%s(%s)" % (f[0].split('/')[-1], f[2])
+        (calls, seconds) = functions.get(name, (0, 0.0))
+        functions[name] = (calls + s[1], seconds + s[2])
+    functions = sorted(functions.items(), key = lambda f: -f[1][1])[:count]
+    return dict([(name, {'calls': calls, 'seconds': round(seconds, 4)}) \
+                 for (name, (calls, seconds)) in functions])
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process in KB, or None.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def run(perft_depth, search_depth, profile = True):
+    """
+    Runs the whole benchmark and returns its report.
+    """
+    report = {
+        'version': REPORT_VERSION,
+        'perft': bench_perft(perft_depth),
+        'search': bench_search(search_depth),
+        'pvs': bench_pvs(search_depth),
+        'play': bench_play(search_depth),
+    }
+    if profile:
+        report['profile'] = bench_profile(search_depth)
+    report['peak_rss_kb'] = peak_rss()
+    return report
+
+def compare(baseline, report, threshold):
+    """
+    Compares a report to a baseline one and returns the list of the
+    regressions found: wrong perft counts, a principal variation search
+    choosing another move than the plain alpha-beta search or not visiting
+    fewer nodes over all the positions, or a search or play() time, node
+    count or peak RSS growing (or NPS dropping) by more than threshold
+    (e.g. 0.2 for 20%). Timings under MIN_SECONDS are not compared.
+    """
+    regressions = []
+    pvs = report.get('pvs', {})
+    for name, search in sorted(pvs.items()):
+        if search['move'] != search['plain_move']:
+            regressions.append("pvs %s: move %s instead of %s" \
+                               % (name, search['move'], search['plain_move']))
+    nodes = sum([search['nodes'] for search in pvs.values()])
+    plain_nodes = sum([search['plain_nodes'] for search in pvs.values()])
+    if nodes > plain_nodes:
+        regressions.append("pvs nodes: %d instead of %d" \
+                           % (nodes, plain_nodes))
+    def worse(kind, name, old, new, higher_is_worse = True):
+        if not old or new is None:
+            return
+        if kind.endswith('seconds') and max(old, new) < MIN_SECONDS:
+            return
+        change = (new - old) / float(old)
+        if (change if higher_is_worse else -change) > threshold:
+            regressions.append("%s %s: %s -> %s (%+.1f%%)" \
+                               % (kind, name, old, new, 100 * change))
+    for name, counts in sorted(baseline.get('perft', {}).items()):
+        for depth, count in sorted(counts.items()):
+            new = report['perft'].get(name, {}).get(depth)
+            if new is not None and new != count:
+                regressions.append("perft %s depth %s: %d -> %d" \
+                                   % (name, depth, count, new))
+    for name, old in sorted(baseline.get('search', {}).items()):
+        new = report['search'].get(name)
+        if new is None or new['depth'] != old['depth']:
+            continue
+        worse('search nodes', name, old['nodes'], new['nodes'])
+        worse('search seconds', name, old['seconds'], new['seconds'])
+        if max(old['seconds'], new['seconds']) >= MIN_SECONDS:
+            worse('search nps', name, old['nps'], new['nps'], False)
+    for name, old in sorted(baseline.get('play', {}).items()):
+        worse('play seconds', name, old, report['play'].get(name))
+    worse('peak rss', 'kb', baseline.get('peak_rss_kb'), \
+          report.get('peak_rss_kb'))
+    return regressions
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Perft and search benchmark of ai.py, with a JSON report.")
+    parser.add_argument('--perft-depth', type = int, default = 5)
+    parser.add_argument('--search-depth', type = int, default = 6)
+    parser.add_argument('--no-profile', action = 'store_true', \
+                        help = "do not profile the searches")
+    parser.add_argument('--output', help = "write the report to this file")
+    parser.add_argument('--compare', metavar = 'BASELINE', \
+                        help = "flag the regressions against this report")
+    parser.add_argument('--threshold', type = float, default = 0.2, \
+                        help = "relative change flagged as a regression")
+    args = parser.parse_args()
+    report = run(args.perft_depth, args.search_depth, not args.no_profile)
+    output = json.dumps(report, indent = 2, sort_keys = True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            sys.stderr.write("REGRESSION: " + regression + "\n")
+        sys.exit(1 if regressions else 0)
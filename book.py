@@ -0,0 +1,179 @@
+import sys
+import time
+import struct
+import argparse
+
+import ai
+import config
+import mapped
+from checkers import BitBoard
+from checkers import SQUARE_POSITIONS
+from checkers import START_POSITION
+
+# Layout of an opening book file: a header holding a magic string and the
+# number of records, followed by fixed size records of (key, move, score,
+# depth) sorted by key, where key is the ai.transposition_key() of the
+# position with the side to move maximizing, and move packs the length of
+# the move on 4 bits and its squares on 5 bits each.
+HEADER = struct.Struct('<8sQ')
+RECORD = struct.Struct('<QQfB')
+MAGIC = b'CKRBOOK1'
+MAX_MOVE_LENGTH = 12
+
+def pack_move(move):
+    """
+    Packs a move (a tuple of at most MAX_MOVE_LENGTH (row, col) positions)
+    into a 64-bit word.
+    """
+    word = len(move)
+    for (i, (row, col)) in enumerate(move):
+        word |= (row * 4 + col // 2) << (4 + 5 * i)
+    return word
+
+def unpack_move(word):
+    """
+    Unpacks the move packed by pack_move().
+    """
+    return tuple([SQUARE_POSITIONS[(word >> (4 + 5 * i)) & 31] \
+                      for i in range(word & 15)])
+
+class OpeningBook(mapped.MappedFile):
+    """
+    An opening book file mapped in memory: a lookup is a binary search over
+    the records of the mapping, so only the pages it touches are ever loaded.
+    """
+
+    kind = 'an opening book'
+
+    def __init__(self, path):
+        """
+        Maps the book file at the given path. Raises a ValueError if it is
+        not a valid book.
+        """
+        mapped.MappedFile.__init__(self, path, HEADER, MAGIC)
+        (self._count, ) = self._header
+        self.check(HEADER.size + self._count * RECORD.size <= len(self._map))
+
+    def __len__(self):
+        """
+        Returns the number of positions of the book.
+        """
+        return self._count
+
+    def lookup(self, key):
+        """
+        Returns the (move, score, depth) recorded for the given key, or None.
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record = RECORD.unpack_from(self._map, \
+                                        HEADER.size + middle * RECORD.size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return (unpack_move(record[1]), record[2], record[3])
+        return None
+
+    def probe(self, board, turn):
+        """
+        Returns the (move, score, depth) recorded for the position of the
+        board with turn to move, or None.
+        """
+        return self.lookup(ai.transposition_key(board, turn, turn))
+
+def write_book(path, entries):
+    """
+    Writes the entries, a dictionary mapping a key to (move, score, depth),
+    to a book file with mapped.write_file().
+    """
+    chunks = [HEADER.pack(MAGIC, len(entries))]
+    for key in sorted(entries):
+        (move, score, depth) = entries[key]
+        chunks.append(RECORD.pack(key, pack_move(move), score, depth))
+    mapped.write_file(path, chunks)
+
+def get_positions(plies):
+    """
+    Returns the positions reached from the start position in at most the
+    given number of plies, as (key, board, turn) tuples without duplicates.
+    """
+    board = BitBoard()
+    ai.initialize(board, START_POSITION)
+    positions = {ai.transposition_key(board, 'black', 'black'): \
+                     (board, 'black')}
+    frontier = list(positions.values())
+    for ply in range(plies):
+        successors = []
+        for (board, turn) in frontier:
+            opponent = 'white' if turn == 'black' else 'black'
+            for move in ai.get_legal_moves(board, turn):
+                child = board.__copy__()
+                ai.make_move(child, move)
+                key = ai.transposition_key(child, opponent, opponent)
+                if key not in positions:
+                    positions[key] = (child, opponent)
+                    successors.append((child, opponent))
+        frontier = successors
+    return [(key, board, turn) for (key, (board, turn)) in positions.items()]
+
+def search_position(board, turn, depth):
+    """
+    Searches a position of the book to the given depth with an empty
+    transposition table, and returns its (move, value).
+    """
+    context = ai.SearchContext(ai.TranspositionTable())
+    return ai.alphabeta_search((board, turn, 0), depth, context)
+
+def build_book(plies, depth, workers = 1):
+    """
+    Searches every position reached in at most plies from the start
+    position to the given depth, over workers processes of
+    ai.get_search_pool(), and returns the book entries of write_book().
+    """
+    positions = get_positions(plies)
+    boards = [board for (key, board, turn) in positions]
+    turns = [turn for (key, board, turn) in positions]
+    depths = [depth] * len(positions)
+    if workers > 1:
+        results = ai.get_search_pool(workers).map(search_position, boards, \
+                                                  turns, depths)
+    else:
+        results = map(search_position, boards, turns, depths)
+    entries = {}
+    for ((key, board, turn), (move, value)) in zip(positions, results):
+        if move != "pass" and len(move) <= MAX_MOVE_LENGTH:
+            entries[key] = (move, value, depth)
+    return entries
+
+def probe(board, turn):
+    """
+    Returns the (move, score, depth) that the book of config.opening_book
+    (see mapped.open_file()) records for the position, or None if there is
+    no such book or position.
+    """
+    opening_book = mapped.open_file(OpeningBook, config.opening_book)
+    if opening_book is None:
+        return None
+    return opening_book.probe(board, turn)
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Builds the opening book by searching every position reached from "
+        "the start position in a few plies.")
+    parser.add_argument('--plies', type = int, default = 4)
+    parser.add_argument('--depth', type = int, default = 10)
+    parser.add_argument('--workers', type = int, \
+                        default = config.search_workers)
+    parser.add_argument('--output', default = config.opening_book)
+    args = parser.parse_args()
+    start = time.time()
+    entries = build_book(args.plies, args.depth, args.workers)
+    write_book(args.output, entries)
+    print("%d positions searched to depth %d in %.1fs, written to %s" \
+          % (len(entries), args.depth, time.time() - start, args.output))
+    sys.exit(0)
@@ -1,3 +1,22 @@
+import random
+
+def crowning_distance(color, row, length):
+    """
+    The distance term of a pawn of the given color on the given row, as used
+    by the evaluation: black pawns count row + 1 and white pawns count
+    length - row.
+    """
+    return row + 1 if color == 'black' else length - (row + 1)
+
+def safe_distance(row, col, length):
+    """
+    The "safe distance" of a square: half the distance from the square to
+    the farthest corner, rounded down. It is the highest on the borders.
+    """
+    r = row if row > (length - (row + 1)) else (length - (row + 1))
+    c = col if col > (length - (col + 1)) else (length - (col + 1))
+    return int(((r ** 2.0 + c ** 2.0) ** 0.5) / 2.0)
+
 class Board(object):
     
     def __init__(self, length = 8):
@@ -54,6 +73,55 @@ class Board(object):
         """
         self._cell[row][col] = None
 
+    def get_hash(self):
+        """
+        Returns the Zobrist hash of the pieces on the board, see
+        get_zobrist_key(): on a 8x8 board, it is the hash a BitBoard holding
+        the same pieces keeps up to date. It is computed at every call.
+        """
+        key = 0
+        for r in range(self._length):
+            for c in range(self._length):
+                piece = self._cell[r][c]
+                if piece is not None:
+                    kind = (0 if piece.is_black() else 2) \
+                        + (1 if piece.is_king() else 0)
+                    key ^= get_zobrist_key(kind, (r * self._length + c) // 2)
+        return key
+
+    def get_positions(self, color):
+        """
+        Returns the (row, col) positions of the pieces of the given color
+        ('black' or 'white'), row by row.
+        """
+        return [(r, c) for r in range(self._length) \
+                    for c in range(self._length) \
+                        if self._cell[r][c] is not None \
+                            and self._cell[r][c].color() == color]
+
+    def get_evaluation_terms(self):
+        """
+        Returns the tuple (black pawns, black kings, white pawns, white kings,
+        black crowning distance, white crowning distance, black safe distance,
+        white safe distance) where the distances are summed over the pawns,
+        see crowning_distance() and safe_distance().
+        """
+        terms = [0] * 8
+        for r in range(self._length):
+            for c in range(self._length):
+                piece = self._cell[r][c]
+                if piece is None:
+                    continue
+                black = 0 if piece.is_black() else 1
+                if piece.is_king():
+                    terms[2 * black + 1] += 1
+                else:
+                    terms[2 * black] += 1
+                    terms[4 + black] += \
+                        crowning_distance(piece.color(), r, self._length)
+                    terms[6 + black] += safe_distance(r, c, self._length)
+        return tuple(terms)
+
     def is_empty(self):
         """
         Returns True if the whole board is empty.
@@ -96,8 +164,8 @@ class Board(object):
             str_ += chr(97 + r) + ' |'
             for c in range(0, self._length):
                 str_ += ' ' + \
-                    (str(self._cell[r][c]) \
-                         if self._cell[r][c] is not None else ' ') + ' |'
+                    (str(self.get(r, c)) \
+                         if self.get(r, c) is not None else ' ') + ' |'
             str_ += vline
         return str_
 
@@ -107,33 +175,299 @@ class Board(object):
         """
         return self.__str__()
 
+# Zobrist keys: one random 64-bit key per kind of piece (black man, black
+# king, white man, white king) and per dark square. The seed is fixed so
+# hashes are the same from one run to another.
+_zobrist_random = random.Random(20190101)
+ZOBRIST_KEYS = [[_zobrist_random.getrandbits(64) for square in range(32)] \
+                    for kind in range(4)]
+
+def get_zobrist_key(kind, square):
+    """
+    Returns the Zobrist key of a kind of piece on the square
+    (row * length + col) // 2 of a board: the key of ZOBRIST_KEYS on the 32
+    dark squares of a 8x8 board, and a key drawn from a seed of its own on
+    the further squares of a larger board.
+    """
+    if square < 32:
+        return ZOBRIST_KEYS[kind][square]
+    return random.Random(20190101 + 4 * square + kind).getrandbits(64)
+
+# The (row, col) position of each of the 32 dark squares of a 8x8 board, and
+# the per square tables of the evaluation terms kept by BitBoard.
+SQUARE_POSITIONS = [(s // 4, 2 * (s % 4) + (1 - (s // 4) % 2)) \
+                        for s in range(32)]
+BLACK_CROWNING_DISTANCE = [crowning_distance('black', r, 8) \
+                               for (r, c) in SQUARE_POSITIONS]
+WHITE_CROWNING_DISTANCE = [crowning_distance('white', r, 8) \
+                               for (r, c) in SQUARE_POSITIONS]
+SAFE_DISTANCE = [safe_distance(r, c, 8) for (r, c) in SQUARE_POSITIONS]
+
+# The start position of a 8x8 game, as the list of strings read by
+# ai.initialize(), black moving first.
+START_POSITION = ['_b_b_b_b',
+                  'b_b_b_b_',
+                  '_b_b_b_b',
+                  '________',
+                  '________',
+                  'w_w_w_w_',
+                  '_w_w_w_w',
+                  'w_w_w_w_']
+
+class BitBoard(Board):
+    """
+    A compact 8x8 board for the search. Only the 32 dark squares (where
+    (row + col) is odd) can hold a piece, so the whole position is kept in
+    four 32-bit masks: black men, black kings, white men and white kings.
+    The square at row r and column c maps to the bit r * 4 + c // 2.
+    It exposes the same get/place/remove/is_free/get_length surface as Board,
+    and copying it only copies four integers.
+    The Zobrist hash of the position and the distance terms of the
+    evaluation are kept up to date by place() and remove(), see get_hash()
+    and get_evaluation_terms().
+    """
+
+    def __init__(self, length = 8):
+        """
+        A bitboard always has a length of 8, any other length is rejected.
+        """
+        if length != 8:
+            raise ValueError("A bitboard only supports a 8x8 board.")
+        self._length = length
+        self._black_men = 0
+        self._black_kings = 0
+        self._white_men = 0
+        self._white_kings = 0
+        self._hash = 0
+        # crowning and safe distances summed over the black and white pawns
+        self._black_distance = 0
+        self._white_distance = 0
+        self._black_safety = 0
+        self._white_safety = 0
+
+    @staticmethod
+    def bit(row, col):
+        """
+        Returns the mask of the dark square at row, col, or 0 for a light
+        square.
+        """
+        if (row + col) % 2 == 0:
+            return 0
+        return 1 << (row * 4 + col // 2)
+
+    def get_masks(self):
+        """
+        Returns the tuple of masks (black men, black kings, white men,
+        white kings).
+        """
+        return (self._black_men, self._black_kings,
+                self._white_men, self._white_kings)
+
+    def get_cells(self):
+        """
+        Builds the NxN list of lists of pieces held by the board.
+        """
+        return [[self.get(r, c) for c in range(self._length)] \
+                    for r in range(self._length)]
+
+    def is_free(self, row, col):
+        """
+        Resturns True if the given position (i.e. tuple) is free.
+        """
+        bit = self.bit(row, col)
+        return not ((self._black_men | self._black_kings | self._white_men \
+                     | self._white_kings) & bit)
+
+    def get_hash(self):
+        """
+        Returns the Zobrist hash of the pieces on the board.
+        """
+        return self._hash
+
+    def place(self, row, col, piece):
+        """
+        Places a piece at the position given by the row-column index,
+        replacing any piece already there. Raises a ValueError on a light
+        square since the masks cannot hold it.
+        """
+        bit = self.bit(row, col)
+        if not bit:
+            raise ValueError("A piece must be placed on a dark square.")
+        self.remove(row, col)
+        if piece is None:
+            return
+        square = row * 4 + col // 2
+        if piece.is_black():
+            if piece.is_king():
+                self._black_kings |= bit
+                self._hash ^= ZOBRIST_KEYS[1][square]
+            else:
+                self._black_men |= bit
+                self._hash ^= ZOBRIST_KEYS[0][square]
+                self._black_distance += BLACK_CROWNING_DISTANCE[square]
+                self._black_safety += SAFE_DISTANCE[square]
+        else:
+            if piece.is_king():
+                self._white_kings |= bit
+                self._hash ^= ZOBRIST_KEYS[3][square]
+            else:
+                self._white_men |= bit
+                self._hash ^= ZOBRIST_KEYS[2][square]
+                self._white_distance += WHITE_CROWNING_DISTANCE[square]
+                self._white_safety += SAFE_DISTANCE[square]
+
+    def get(self, row, col):
+        """
+        Gets the piece located at the position indexed by the row-column value.
+        Does not check any validity condition.
+        """
+        bit = self.bit(row, col)
+        if self._black_men & bit:
+            return BLACK_PAWN
+        if self._black_kings & bit:
+            return BLACK_KING
+        if self._white_men & bit:
+            return WHITE_PAWN
+        if self._white_kings & bit:
+            return WHITE_KING
+        return None
+
+    def remove(self, row, col):
+        """
+        Removes a piece from the position given by the row-column index.
+        This does not check any validity condition.
+        """
+        bit = self.bit(row, col)
+        square = row * 4 + col // 2
+        if self._black_men & bit:
+            self._black_men ^= bit
+            self._hash ^= ZOBRIST_KEYS[0][square]
+            self._black_distance -= BLACK_CROWNING_DISTANCE[square]
+            self._black_safety -= SAFE_DISTANCE[square]
+        elif self._black_kings & bit:
+            self._black_kings ^= bit
+            self._hash ^= ZOBRIST_KEYS[1][square]
+        elif self._white_men & bit:
+            self._white_men ^= bit
+            self._hash ^= ZOBRIST_KEYS[2][square]
+            self._white_distance -= WHITE_CROWNING_DISTANCE[square]
+            self._white_safety -= SAFE_DISTANCE[square]
+        elif self._white_kings & bit:
+            self._white_kings ^= bit
+            self._hash ^= ZOBRIST_KEYS[3][square]
+
+    def get_positions(self, color):
+        """
+        Returns the (row, col) positions of the pieces of the given color
+        ('black' or 'white'), row by row.
+        """
+        if color == 'black':
+            mask = self._black_men | self._black_kings
+        else:
+            mask = self._white_men | self._white_kings
+        positions = []
+        while mask:
+            low = mask & -mask
+            positions.append(SQUARE_POSITIONS[low.bit_length() - 1])
+            mask ^= low
+        return positions
+
+    def get_evaluation_terms(self):
+        """
+        Returns the same tuple as Board.get_evaluation_terms() without
+        scanning the board: the counts are those of the bits of the masks
+        and the distances are kept up to date by place() and remove().
+        """
+        return (bin(self._black_men).count('1'),
+                bin(self._black_kings).count('1'),
+                bin(self._white_men).count('1'),
+                bin(self._white_kings).count('1'),
+                self._black_distance, self._white_distance,
+                self._black_safety, self._white_safety)
+
+    def is_empty(self):
+        """
+        Returns True if the whole board is empty.
+        """
+        return not (self._black_men | self._black_kings \
+                    | self._white_men | self._white_kings)
+
+    def __copy__(self):
+        """
+        Copies the board, which only means copying its four masks, its hash
+        and its distance terms.
+        """
+        board = BitBoard.__new__(BitBoard)
+        board._length = self._length
+        board._black_men = self._black_men
+        board._black_kings = self._black_kings
+        board._white_men = self._white_men
+        board._white_kings = self._white_kings
+        board._hash = self._hash
+        board._black_distance = self._black_distance
+        board._white_distance = self._white_distance
+        board._black_safety = self._black_safety
+        board._white_safety = self._white_safety
+        return board
+
+    def __deepcopy__(self, memo):
+        """
+        The masks are immutable integers, so a deep copy is a plain copy.
+        """
+        return self.__copy__()
+
+# The shared pieces, by (color, is_king), see Piece.__new__().
+_pieces = {}
+
 class Piece(object):
     """
     This class encapsulates a Piece object. In the Checkers game a piece is
     a small piece which is colored black on once side and white on the other.
+    There are only four pieces, one per color and kind, shared by all the
+    boards: a piece is immutable, so promoting a pawn means placing the king
+    of its color on its square, and two pieces are equal if they are the
+    same object.
     """
 
+    __slots__ = ('_color', '_is_king')
+
     """ The symbols for the pieces: black and white circles. """
     symbols = ['b', 'w']
-
-    # the flag to denote if a piece is a king
-    _is_king = False
     symbols_king = ['B', 'W']
 
-    def __init__(self, color = 'black', is_king = False):
+    def __new__(cls, color = 'black', is_king = False):
         """
-        The default color is always black, i.e. 'black'.
+        Returns the piece of the given color and kind. The default color is
+        always black, i.e. 'black'.
         """
         if color.isalpha():
             color = color.lower()
             if color == 'black' or color == 'white':
-                self._color = color
-                self._is_king  = is_king
+                key = (color, bool(is_king))
+                piece = _pieces.get(key)
+                if piece is None:
+                    piece = object.__new__(cls)
+                    object.__setattr__(piece, '_color', key[0])
+                    object.__setattr__(piece, '_is_king', key[1])
+                    _pieces[key] = piece
+                return piece
             else:
                 raise ValueError("A piece must be \'black\' or \'white\'.")
         else:
             raise ValueError("A piece must be \'black\' or \'white\'.")
 
+    def __setattr__(self, name, value):
+        """
+        Pieces are immutable.
+        """
+        raise AttributeError("A piece is immutable.")
+
+    def __delattr__(self, name):
+        """
+        Pieces are immutable.
+        """
+        raise AttributeError("A piece is immutable.")
+
     def color(self):
         """
         Returns the color of the piece.
@@ -158,18 +492,35 @@ class Piece(object):
         """
         return self._is_king
 
+    def get_king(self):
+        """
+        Returns the king of the color of this piece.
+        """
+        return Piece(self._color, True)
+
+    def get_pawn(self):
+        """
+        Returns the pawn of the color of this piece.
+        """
+        return Piece(self._color, False)
+
+    def __copy__(self):
+        """
+        A piece is immutable, so it is its own copy.
+        """
+        return self
 
-    def turn_king(self):
+    def __deepcopy__(self, memo):
         """
-        Turns this piece into a king from pawn.
+        A piece is immutable, so it is its own copy.
         """
-        self._is_king = True
+        return self
 
-    def turn_pawn(self):
+    def __reduce__(self):
         """
-        Turns this piece from king to pawn.
+        Unpickles to the shared piece of the same color and kind.
         """
-        self.is_king = False
+        return (Piece, (self._color, self._is_king))
 
     def __str__(self):
         """
@@ -187,3 +538,8 @@ class Piece(object):
         The function for the REPL printing.
         """
         return self.__str__()
+
+BLACK_PAWN = Piece('black')
+BLACK_KING = Piece('black', True)
+WHITE_PAWN = Piece('white')
+WHITE_KING = Piece('white', True)
@@ -0,0 +1,158 @@
+import sys
+import json
+import time
+import argparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import main
+
+# The statuses of the transient failures of the game server.
+RETRY_STATUSES = (502, 503, 504)
+
+class Latencies(object):
+    """
+    The latencies of the requests sent to the game server, in seconds, to
+    split the time of a game between the network and the engine.
+    """
+
+    def __init__(self):
+        self.seconds = []
+
+    def clear(self):
+        """
+        Forgets the latencies recorded so far.
+        """
+        self.seconds = []
+
+    def record(self, seconds):
+        """
+        Records the latency of a request.
+        """
+        self.seconds.append(seconds)
+
+    def get_total(self):
+        """
+        Returns the time spent waiting for the server.
+        """
+        return sum(self.seconds)
+
+    def as_dict(self):
+        """
+        Returns the number of requests and their total, mean, median, 95th
+        percentile and largest latency, ready to be dumped as JSON.
+        """
+        seconds = sorted(self.seconds)
+        if not seconds:
+            return {'requests': 0}
+        return {
+            'requests': len(seconds),
+            'seconds': round(sum(seconds), 4),
+            'mean': round(sum(seconds) / len(seconds), 4),
+            'median': round(seconds[len(seconds) // 2], 4),
+            'p95': round(seconds[int(0.95 * (len(seconds) - 1))], 4),
+            'max': round(seconds[-1], 4),
+        }
+
+# The latencies of the requests of send_request().
+latencies = Latencies()
+
+# The session of send_request(), created on first use.
+session = None
+
+def get_session():
+    """
+    Returns the requests.Session shared by every request to the game server:
+    its connections are kept alive from one request to the next, up to
+    config.http_pool_size of them. A request failing to connect is retried
+    config.http_retries times with an exponential backoff, as is a GET
+    request answered by one of RETRY_STATUSES. A POST request which reached
+    the server is never sent again, since it may have played the move.
+    """
+    global session
+    if session is None:
+        retry = Retry(total = config.http_retries, \
+                      backoff_factor = config.http_backoff, \
+                      status_forcelist = RETRY_STATUSES, \
+                      allowed_methods = frozenset(['GET']), \
+                      raise_on_status = False)
+        adapter = HTTPAdapter(pool_connections = config.http_pool_size, \
+                              pool_maxsize = config.http_pool_size, \
+                              max_retries = retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+def read_response(response):
+    """
+    Returns the JSON content of a response of the game server, raising the
+    exceptions of main.send_request() for an invalid move or an error.
+    """
+    try:
+        content = json.loads(response.content.decode('utf-8'))
+    except ValueError:
+        raise Exception('Could not decode response')
+    if 'error' in content:
+        if response.status_code == 200 and content['error'] == 'InvalidMove':
+            raise main.InvalidMoveException()
+        raise Exception(content['error'])
+    if response.status_code != 200:
+        raise Exception('Unknown error')
+    return content
+
+def send_request(url, method, data = {}):
+    """
+    Sends a request to the game server as main.send_request() does, over
+    the session of get_session() and with the timeouts of the configuration,
+    and records its latency.
+    """
+    timeout = (config.http_connect_timeout, config.http_read_timeout)
+    start = time.time()
+    if method == 'get':
+        response = get_session().get(url, params = data, timeout = timeout)
+    elif method == 'post':
+        response = get_session().post(url, data = data, timeout = timeout)
+    else:
+        raise Exception('Bad method')
+    latencies.record(time.time() - start)
+    return read_response(response)
+
+def play_game(player, size, candidate_color):
+    """
+    Plays a game as main.play_game() does, with main.send_request()
+    replaced by send_request(), and prints the time spent waiting for the
+    server and the time left to the engine.
+    """
+    main.send_request = send_request
+    latencies.clear()
+    start = time.time()
+    result = main.play_game(player, size, candidate_color)
+    seconds = time.time() - start
+    network = latencies.as_dict()
+    print("Game played in %.2fs: %.2fs for the engine, %.2fs for %d " \
+          "requests to the server (%s)" \
+          % (seconds, seconds - latencies.get_total(), \
+             latencies.get_total(), network['requests'], \
+             json.dumps(network, sort_keys = True)))
+    return result
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Plays the games of main.py over a pooled HTTP session, and reports "
+        "the time spent in the network and in the engine.")
+    parser.add_argument('--server', default = main.url_prefix, \
+                        help = "the URL prefix of the game server")
+    args = parser.parse_args()
+    main.url_prefix = args.server
+    player = main.read_config()
+    main.set_color_flag()
+    if not play_game(player, 8, 'b'):
+        print("You made an invalid move. Please check your code.")
+    if not play_game(player, 8, 'w'):
+        print("You made an invalid move. Please check your code.")
+    sys.exit(0)
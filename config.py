@@ -1 +1,60 @@
 use_cpp_implementation = False
+
+# Number of entries of the transposition table used by the alpha-beta search
+transposition_table_size = 2 ** 18
+
+# Wall-clock time (in seconds) given to the search of each move, and the
+# deepest iteration of the iterative deepening search
+search_time_budget = 2.0
+search_max_depth = 32
+
+# Number of processes searching the root moves in parallel, 1 searches in
+# the main process only
+search_workers = 1
+
+# With several search_workers, run a Lazy SMP search (every worker searches
+# the whole tree and they share a transposition table in shared memory)
+# instead of splitting the root moves between them
+lazy_smp = False
+
+# Collect the statistics of each search (see ai.SearchStats), printed as JSON
+# after "Thinking ..."
+search_stats = False
+
+# Keep searching the capture paths past the depth limit of the search, so
+# the positions evaluated are quiet ones
+quiescence_search = True
+
+# Search the moves after the first one of each node with a null window,
+# and only search them again with the whole window if they beat it
+principal_variation_search = True
+
+# Half width of the window around the value of the previous iteration the
+# iterations of the search start with, 0 for the whole window
+aspiration_window = 0.5
+
+# Search the position expected after the reply of the opponent in a
+# background thread while the opponent thinks, for at most
+# ponder_time_budget seconds
+ponder = False
+ponder_time_budget = 30.0
+
+# The opening book played before searching, built by book.py (a path
+# relative to this directory, None for no book)
+opening_book = 'book.bin'
+
+# The endgame tablebase probed by the search once few pieces are left,
+# built by tablebase.py (a path relative to this directory, None for no
+# tablebase)
+tablebase = 'tablebase.bin'
+
+# The HTTP client of client.py: the number of connections kept alive to the
+# game server, the timeouts (in seconds) to connect to it and to read its
+# answer, and the number of retries of the requests that fail to connect
+# (or of the GET requests answered by a 502, 503 or 504 status), with an
+# exponential backoff starting from http_backoff seconds
+http_pool_size = 4
+http_connect_timeout = 5.0
+http_read_timeout = 30.0
+http_retries = 3
+http_backoff = 0.5
@@ -0,0 +1,82 @@
+import os
+import mmap
+
+class MappedFile(object):
+    """
+    A read-only binary file mapped in memory: nothing but its header is read
+    when it is opened, and only the pages its lookups touch are ever loaded.
+    The file starts with a header, a struct.Struct whose first field is the
+    magic string of the format, and the subclasses check the rest with
+    check().
+    """
+
+    """ How the errors name a file of the format. """
+    kind = 'a mapped file'
+
+    def __init__(self, path, header, magic):
+        """
+        Maps the file at the given path and keeps the fields of its header
+        after the magic string in _header. Raises a ValueError if it is not
+        a file of the format.
+        """
+        self._path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, \
+                                  access = mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("%s is not %s." % (path, self.kind))
+        self.check(len(self._map) >= header.size)
+        fields = header.unpack_from(self._map, 0)
+        self.check(fields[0] == magic)
+        self._header = fields[1:]
+
+    def check(self, condition):
+        """
+        Unmaps the file and raises a ValueError unless the condition holds.
+        """
+        if not condition:
+            self.close()
+            raise ValueError("%s is not %s." % (self._path, self.kind))
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        self._map.close()
+        self._file.close()
+
+def write_file(path, chunks):
+    """
+    Writes the chunks (bytes) to the file at the given path. They are
+    written to a temporary file first, which then replaces the file at once,
+    so a process mapping the previous one keeps reading it.
+    """
+    with open(path + '.tmp', 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(path + '.tmp', path)
+
+# The files of open_file(), by class, with their paths.
+opened_files = {}
+
+def open_file(cls, name):
+    """
+    Returns the cls (a MappedFile subclass) of the file of the given name, a
+    path relative to this directory, mapped on first use and unmapped once
+    another name is asked for. Returns None if the name is empty or there
+    is no such file.
+    """
+    if not name:
+        return None
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    (opened, opened_path) = opened_files.get(cls, (None, None))
+    if opened_path != path:
+        if opened is not None:
+            opened.close()
+        (opened, opened_path) = (None, path)
+    if opened is None and os.path.isfile(path):
+        opened = cls(path)
+    opened_files[cls] = (opened, opened_path)
+    return opened
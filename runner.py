@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import concurrent.futures
+
+import ai
+import main
+import client
+import config
+
+class RunStats(object):
+    """
+    The aggregate statistics of the games of a run: their results from the
+    point of view of the engine, the moves it played, the time it spent
+    thinking and the time of the whole run.
+    """
+
+    RESULTS = ('win', 'draw', 'loss', 'invalid', 'error')
+
+    def __init__(self):
+        self.results = dict([(result, 0) for result in self.RESULTS])
+        self.games = 0
+        self.moves = 0
+        self.engine_seconds = 0.0
+        self.seconds = 0.0
+
+    def record(self, result, moves, engine_seconds):
+        """
+        Records a game ended by the given result.
+        """
+        self.results[result] += 1
+        self.games += 1
+        self.moves += moves
+        self.engine_seconds += engine_seconds
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary, ready to be dumped as JSON,
+        with the network latencies of client.latencies.
+        """
+        hours = self.seconds / 3600.0
+        return {
+            'games': self.games,
+            'results': dict(self.results),
+            'moves': self.moves,
+            'seconds': round(self.seconds, 2),
+            'games_per_hour': round(self.games / hours, 1) if hours else 0,
+            'moves_per_second': \
+                round(self.moves / self.seconds, 2) if self.seconds else 0,
+            'engine_seconds_per_move': \
+                round(self.engine_seconds / self.moves, 4) \
+                if self.moves else 0,
+            'network': client.latencies.as_dict(),
+        }
+
+async def send_request(http_pool, url, method, data = {}):
+    """
+    Sends a request to the game server with client.send_request(), in a
+    thread of the http_pool so the other games go on meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(http_pool, client.send_request, \
+                                      url, method, data)
+
+async def play_game(workers, http_pool, player, size, color):
+    """
+    Plays a game as main.play_game() does, the engine thinking in the
+    process of ai.get_game_pool() of the game, and returns its (result,
+    moves, engine seconds) where result is one of RunStats.RESULTS.
+    """
+    loop = asyncio.get_running_loop()
+    data = dict(player, size = size, color = color)
+    game = await send_request(http_pool, main.url_prefix + 'games', 'post', \
+                              data)
+    board = game['board']
+    moves, engine_seconds = 0, 0.0
+    while True:
+        start = time.time()
+        pool = ai.get_game_pool(game['id'], workers)
+        move = await loop.run_in_executor(pool, ai.engine_move, game['id'], \
+                                          board, color)
+        engine_seconds += time.time() - start
+        moves += 1
+        try:
+            response = await send_request(http_pool, \
+                main.url_prefix + 'games/%d' % game['id'], 'post', \
+                {'move': [list(m) for m in move]})
+        except main.InvalidMoveException:
+            return ('invalid', moves, engine_seconds)
+        if response['over']:
+            if response['winner'] == color:
+                result = 'win'
+            elif response['winner'] == ' ':
+                result = 'draw'
+            else:
+                result = 'loss'
+            return (result, moves, engine_seconds)
+        board = response['board']
+
+async def run_games(player, games, concurrency, workers, size = 8):
+    """
+    Plays the given number of games, the engine playing black and white in
+    turn, keeping at most concurrency games in flight and thinking over
+    workers processes of ai.get_game_pool(). Every move of a game is
+    searched by the same process, which keeps the search state of the game
+    from one move to the next, see ai.engine_move().
+    Returns the RunStats of the games.
+    """
+    stats = RunStats()
+    colors = [('b', 'w')[i % 2] for i in range(games)]
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as http_pool:
+        async def worker():
+            while colors:
+                color = colors.pop(0)
+                try:
+                    result = await play_game(workers, http_pool, \
+                                             player, size, color)
+                except Exception as e:
+                    sys.stderr.write("Game failed: %s\n" % e)
+                    result = ('error', 0, 0.0)
+                stats.record(*result)
+        await asyncio.gather(*[worker() for i in range(concurrency)])
+    stats.seconds = time.time() - start
+    return stats
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Plays many games against the game server concurrently, and reports "
+        "the results and the throughput as JSON.")
+    parser.add_argument('--games', type = int, default = 2)
+    parser.add_argument('--concurrency', type = int, default = 4, \
+                        help = "the number of games in flight at once")
+    parser.add_argument('--workers', type = int, \
+                        default = os.cpu_count() or 1, \
+                        help = "the number of engine processes")
+    parser.add_argument('--server', default = main.url_prefix, \
+                        help = "the URL prefix of the game server")
+    args = parser.parse_args()
+    main.url_prefix = args.server
+    config.http_pool_size = max(config.http_pool_size, args.concurrency)
+    player = main.read_config()
+    stats = asyncio.run(run_games(player, args.games, args.concurrency, \
+                                  args.workers))
+    print(json.dumps(stats.as_dict(), indent = 2, sort_keys = True))
+    sys.exit(0 if stats.results['invalid'] == stats.results['error'] == 0 \
+             else 1)
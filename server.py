@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import random
+import argparse
+import threading
+import itertools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import ai
+import config
+from checkers import BitBoard
+from checkers import START_POSITION
+
+# The number of plies after which a game is a draw.
+MAX_PLIES = 200
+
+def random_move(id, board, color, budget = None):
+    """
+    Returns a move of ai.allowed_moves() picked at random, whatever the
+    game and the time budget.
+    """
+    return random.choice(ai.allowed_moves(board, color))
+
+# The opponents the server can play with.
+OPPONENTS = {'random': random_move, 'engine': ai.engine_move}
+
+def apply_move(board, move):
+    """
+    Returns the board (as a list of strings) after the move.
+    """
+    b = BitBoard(len(board))
+    ai.initialize(b, board)
+    ai.make_move(b, [tuple(p) for p in move])
+    return ai.get_rows(b)
+
+class Game(object):
+    """
+    A game in progress on the server: its board, the color of the candidate
+    playing against the server, the number of plies played and the lock
+    taken to play a move.
+    """
+
+    def __init__(self, id, color):
+        self.id = id
+        self.color = color
+        self.opponent_color = 'w' if color == 'b' else 'b'
+        self.board = list(START_POSITION)
+        self.plies = 0
+        self.lock = threading.Lock()
+
+class GameServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the game server of main.py, with the same JSON
+    protocol: a POST to games starts a game and a POST to games/<id> plays
+    a move of the candidate and the reply of the server. The moves of the
+    candidate are checked against ai.allowed_moves() and the replies are
+    played by one of OPPONENTS. The engine opponent thinks for time_budget
+    seconds (config.search_time_budget by default) in the process of
+    ai.get_game_pool() of the game, one of workers, so the games go on
+    concurrently, each request being served by its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, opponent = 'random', workers = 1, \
+                 max_plies = MAX_PLIES, verbose = False, time_budget = None):
+        ThreadingHTTPServer.__init__(self, address, GameHandler)
+        self.opponent = OPPONENTS[opponent]
+        self.time_budget = time_budget
+        self.workers = workers if opponent == 'engine' else None
+        self.max_plies = max_plies
+        self.verbose = verbose
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def play_opponent(self, game):
+        """
+        Plays the reply of the server in the game, and returns it.
+        """
+        if self.workers is None:
+            move = self.opponent(game.id, game.board, game.opponent_color, \
+                                 self.time_budget)
+        else:
+            pool = ai.get_game_pool(game.id, self.workers)
+            move = pool.submit(self.opponent, game.id, game.board, \
+                               game.opponent_color, self.time_budget).result()
+        game.board = apply_move(game.board, move)
+        game.plies += 1
+        return [list(p) for p in move]
+
+    def end_game(self, game, response, winner):
+        """
+        Ends the game with the given winner (' ' for a draw).
+        """
+        response['over'] = True
+        response['winner'] = winner
+        with self.lock:
+            del self.games[game.id]
+
+    def new_game(self, data):
+        """
+        Starts a game and returns its id and board, after the first move of
+        the server if the candidate plays white.
+        """
+        if data.get('color') not in ('b', 'w'):
+            raise ValueError("The color must be 'b' or 'w'.")
+        if data.get('size', 8) != len(START_POSITION):
+            raise ValueError("Only the size %d is supported." \
+                             % len(START_POSITION))
+        with self.lock:
+            game = Game(next(self.ids), data['color'])
+            self.games[game.id] = game
+        response = {'id': game.id}
+        with game.lock:
+            if game.color == 'w':
+                response['move'] = self.play_opponent(game)
+            response['board'] = game.board
+        return response
+
+    def get_game(self, id):
+        """
+        Returns the game in progress with the given id, or None.
+        """
+        with self.lock:
+            return self.games.get(id)
+
+    def new_move(self, game, move):
+        """
+        Plays a move of the candidate and the reply of the server in the
+        game, and returns the boards after each of them, the reply and
+        whether the game is over.
+        """
+        with game.lock:
+            try:
+                move = [tuple(p) for p in move]
+            except TypeError:
+                raise ValueError("A move is a list of [row, col] squares.")
+            if move not in ai.allowed_moves(game.board, game.color):
+                return {'error': 'InvalidMove'}
+            game.board = apply_move(game.board, move)
+            game.plies += 1
+            response = {'board_after_candidate_move': game.board, \
+                        'over': False}
+            if not ai.allowed_moves(game.board, game.opponent_color):
+                self.end_game(game, response, game.color)
+            elif game.plies >= self.max_plies:
+                self.end_game(game, response, ' ')
+            else:
+                response['move'] = self.play_opponent(game)
+                if not ai.allowed_moves(game.board, game.color):
+                    self.end_game(game, response, game.opponent_color)
+                elif game.plies >= self.max_plies:
+                    self.end_game(game, response, ' ')
+            response['board'] = game.board
+            return response
+
+class GameHandler(BaseHTTPRequestHandler):
+    """
+    The handler of the requests of a GameServer. The connections are kept
+    alive from one request to the next, and the headers and the body of a
+    response are not delayed by the Nagle algorithm.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def read_data(self):
+        """
+        Returns the data of the request, sent as JSON or form encoded as
+        main.send_request() does: the move is then a flat list of
+        coordinates and every other field is a single value. Raises a
+        ValueError unless the JSON is an object.
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("The body must be a JSON object.")
+            return data
+        fields = parse_qs(body)
+        data = dict([(k, v[0]) for (k, v) in fields.items()])
+        if 'size' in data:
+            data['size'] = int(data['size'])
+        if 'move' in fields:
+            squares = [int(s) for s in fields['move']]
+            data['move'] = [squares[i:i + 2] \
+                            for i in range(0, len(squares), 2)]
+        return data
+
+    def reply(self, status, content):
+        """
+        Sends the content as JSON with the given status.
+        """
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/').split('/')
+        try:
+            data = self.read_data()
+            if path[-1] == 'games':
+                self.reply(200, self.server.new_game(data))
+            elif len(path) > 1 and path[-2] == 'games':
+                game = self.server.get_game(int(path[-1]))
+                if game is None:
+                    self.reply(404, {'error': 'Unknown game'})
+                else:
+                    self.reply(200, self.server.new_move(game, \
+                                                         data.get('move')))
+            else:
+                self.reply(404, {'error': 'Not found'})
+        except ValueError as e:
+            self.reply(400, {'error': str(e)})
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Serves the games of main.py locally, the server playing with a "
+        "random or an engine opponent.")
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--opponent', choices = sorted(OPPONENTS), \
+                        default = 'random')
+    parser.add_argument('--workers', type = int, \
+                        default = os.cpu_count() or 1, \
+                        help = "the number of engine opponent processes")
+    parser.add_argument('--time-budget', type = float, \
+                        default = config.search_time_budget, \
+                        help = "the thinking time of the engine opponent")
+    parser.add_argument('--max-plies', type = int, default = MAX_PLIES, \
+                        help = "the number of plies of a drawn game")
+    parser.add_argument('--seed', type = int, \
+                        help = "the seed of the random opponent")
+    parser.add_argument('--verbose', action = 'store_true', \
+                        help = "log every request")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    server = GameServer((args.host, args.port), args.opponent, \
+                        args.workers, args.max_plies, args.verbose, \
+                        args.time_budget)
+    print("Serving games on http://%s:%d/checkers/" \
+          % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    sys.exit(0)
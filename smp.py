@@ -0,0 +1,289 @@
+import sys
+import time
+import copy
+import struct
+import atexit
+import argparse
+from multiprocessing import shared_memory
+
+import ai
+import config
+from checkers import BitBoard
+from checkers import SQUARE_POSITIONS
+from checkers import START_POSITION
+
+# Layout of the shared transposition table: a header holding the generation
+# of the current search and the stop flag, followed by fixed size entries of
+# (check, data, value, move, move) where data packs the depth, the bound, the
+# generation and the length of the move, and the two move words pack the
+# squares of the move on 5 bits each. The check word is the key xored with
+# the 4 other words, so an entry torn by concurrent writes is never read back.
+HEADER = struct.Struct('<QQ')
+ENTRY = struct.Struct('<QQdQQ')
+MASK = (1 << 64) - 1
+MAX_MOVE_LENGTH = 24
+
+def encode_move(move):
+    """
+    Packs a move (a tuple of (row, col) positions) into two 64-bit words.
+    """
+    words = 0
+    for (i, (row, col)) in enumerate(move):
+        words |= (row * 4 + col // 2) << (5 * i)
+    return (words & MASK, words >> 64)
+
+def decode_move(low, high, length):
+    """
+    Unpacks the move packed by encode_move().
+    """
+    words = low | (high << 64)
+    return tuple([SQUARE_POSITIONS[(words >> (5 * i)) & 31] \
+                      for i in range(length)])
+
+class SharedTranspositionTable(object):
+    """
+    A transposition table held in a multiprocessing.shared_memory buffer, so
+    every process of a Lazy SMP search reads and writes the same entries
+    without any lock. It has the same interface and replacement policy as
+    ai.TranspositionTable. Only moves of at most MAX_MOVE_LENGTH squares are
+    stored, and a value read back is always a float.
+    """
+
+    def __init__(self, size = None, name = None):
+        """
+        Creates a new table of the given size (config.transposition_table_size
+        by default), or attaches to the existing one with the given name.
+        """
+        if size is None:
+            size = config.transposition_table_size
+        if size < 1:
+            raise ValueError("A transposition table needs at least 1 entry.")
+        self._size = size
+        nbytes = HEADER.size + size * ENTRY.size
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create = True, \
+                                                      size = nbytes)
+            self._owner = True
+            self.clear()
+        else:
+            self._memory = shared_memory.SharedMemory(name = name)
+            self._owner = False
+        self._buffer = self._memory.buf
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_name(self):
+        """
+        Returns the name of the shared memory buffer, to attach to it.
+        """
+        return self._memory.name
+
+    def get_size(self):
+        """
+        Returns the number of slots of the table.
+        """
+        return self._size
+
+    def advance(self):
+        """
+        Starts a new search for every process sharing the table: the entries
+        of the previous ones become the first to be replaced, and the stop
+        flag is cleared.
+        """
+        (generation, stop) = HEADER.unpack_from(self._buffer, 0)
+        HEADER.pack_into(self._buffer, 0, (generation + 1) & 0xffff, 0)
+
+    def new_search(self):
+        """
+        Reloads the generation set by the last advance().
+        """
+        self._generation = HEADER.unpack_from(self._buffer, 0)[0]
+
+    def stop(self):
+        """
+        Raises the stop flag read by is_stopped().
+        """
+        HEADER.pack_into(self._buffer, 0, self._generation, 1)
+
+    def is_stopped(self):
+        """
+        Returns True once some process called stop() in this search.
+        """
+        return HEADER.unpack_from(self._buffer, 0)[1] != 0
+
+    def clear(self):
+        """
+        Empties the table and resets its counters.
+        """
+        self._memory.buf[:] = bytes(len(self._memory.buf))
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Detaches from the shared buffer, and frees it in the creating process.
+        """
+        self._buffer = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def _read(self, index):
+        """
+        Returns the entry of the slot as an ai.TranspositionTable tuple, or
+        None if the slot is empty or torn.
+        """
+        (check, data, value, low, high) = \
+            ENTRY.unpack_from(self._buffer, HEADER.size + index * ENTRY.size)
+        if check == 0 and data == 0:
+            return None
+        value_bits = struct.unpack('<Q', struct.pack('<d', value))[0]
+        key = check ^ data ^ value_bits ^ low ^ high
+        depth, bound = data & 0xff, (data >> 8) & 0x3
+        generation, length = (data >> 10) & 0xffff, (data >> 26) & 0x1f
+        move = decode_move(low, high, length) if length else None
+        return (key, depth, bound, value, move, generation)
+
+    def probe(self, key):
+        """
+        Returns the entry stored for the given key, or None.
+        """
+        entry = self._read(key % self._size)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        """
+        Stores the result of a search according to the replacement policy.
+        """
+        index = key % self._size
+        entry = self._read(index)
+        if entry is None or entry[0] == key \
+                or entry[5] != self._generation or depth >= entry[1]:
+            if move is None or len(move) > MAX_MOVE_LENGTH:
+                move = ()
+            (low, high) = encode_move(move)
+            data = min(depth, 0xff) | (bound << 8) \
+                | (self._generation << 10) | (len(move) << 26)
+            value = float(value)
+            value_bits = struct.unpack('<Q', struct.pack('<d', value))[0]
+            check = key ^ data ^ value_bits ^ low ^ high
+            ENTRY.pack_into(self._buffer, HEADER.size + index * ENTRY.size, \
+                            check, data, value, low, high)
+
+class SmpContext(ai.SearchContext):
+    """
+    The search context of a Lazy SMP worker: the search is also abandoned
+    once another worker raised the stop flag of the shared table.
+    """
+
+    def is_stopped(self):
+        """
+        Returns True once a worker raised the stop flag of the shared table.
+        """
+        return self.table.is_stopped()
+
+# The shared table of the Lazy SMP search, created on first use in the main
+# process, and the tables attached to by each worker, by name.
+shared_table = None
+attached_tables = {}
+
+def get_shared_table():
+    """
+    Returns the shared table of the Lazy SMP search, of
+    config.transposition_table_size entries.
+    """
+    global shared_table
+    if shared_table is None:
+        shared_table = SharedTranspositionTable()
+        atexit.register(shared_table.close)
+    return shared_table
+
+def lazy_smp_worker(board, turn, deadline, maxdepth, name, size, index):
+    """
+    The iterative deepening of one Lazy SMP worker. Workers are staggered:
+    the odd ones start one ply deeper, and the first iteration of each one
+    searches first the root move at its index, the next ones the best move
+    of the previous iteration.
+    Returns the (move, value, depth) of the deepest completed iteration, or
+    None. The worker completing maxdepth stops the others.
+    """
+    if name not in attached_tables:
+        attached_tables[name] = SharedTranspositionTable(size, name)
+    table = attached_tables[name]
+    table.new_search()
+    context = SmpContext(table, deadline)
+    state = (board, turn, 0)
+    actions = ai.get_legal_moves(board, turn)
+    first = actions[index % len(actions)]
+    best = None
+    depth = 1 + index % 2
+    while maxdepth is None or depth <= maxdepth:
+        try:
+            result = ai.alphabeta_search(state, depth, context, first)
+        except ai.SearchTimeout:
+            break
+        best = (result[0], result[1], depth)
+        first = result[0]
+        depth += 1
+    if best is not None and best[2] == maxdepth:
+        table.stop()
+    return best
+
+def lazy_smp_search(state, budget, maxdepth = None, workers = None):
+    """
+    The Lazy SMP search: workers processes (config.search_workers by
+    default) of ai.get_search_pool() all run an iterative deepening search of
+    the whole tree, and only share the transposition table held in shared
+    memory. It stops once the time budget (in seconds) is spent or a worker
+    completes maxdepth, and returns the (move, value, depth) of the deepest
+    completed iteration, the lowest worker winning ties. If no worker
+    completed an iteration in time, the move is that of a serial search of
+    depth 1.
+    """
+    if workers is None:
+        workers = config.search_workers
+    deadline = time.time() + budget
+    board = state[0]
+    actions = ai.get_legal_moves(board, state[1])
+    if len(actions) == 1:
+        return (actions[0], 0, 0)
+    if not actions:
+        return ("pass", -1, 0)
+    table = get_shared_table()
+    table.advance()
+    pool = ai.get_search_pool(workers)
+    futures = [pool.submit(lazy_smp_worker, copy.deepcopy(board), state[1], \
+                           deadline, maxdepth, table.get_name(), \
+                           table.get_size(), i) for i in range(workers)]
+    results = [f.result() for f in futures]
+    results = [(r, -i) for (i, r) in enumerate(results) if r is not None]
+    if not results:
+        return ai.iterative_deepening_search(state, 0, maxdepth)
+    return max(results, key = lambda r: (r[0][2], r[1]))[0]
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Times the Lazy SMP search to a fixed depth against a single worker.")
+    parser.add_argument('--workers', type = int, default = 4)
+    parser.add_argument('--depth', type = int, default = 7)
+    args = parser.parse_args()
+    board = BitBoard()
+    ai.initialize(board, START_POSITION)
+    times = {}
+    for workers in sorted(set([1, args.workers])):
+        get_shared_table().clear()
+        start = time.time()
+        move = lazy_smp_search((board, 'black', 0), float('inf'), \
+                               args.depth, workers)
+        times[workers] = time.time() - start
+        print("%d worker(s): depth %d in %.2fs, move %s" \
+              % (workers, move[2], times[workers], list(move[0])))
+    print("Speedup: %.2fx" % (times[1] / times[args.workers]))
+    sys.exit(0)
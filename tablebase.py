@@ -0,0 +1,311 @@
+import sys
+import time
+import struct
+import argparse
+import itertools
+
+import ai
+import config
+import mapped
+from checkers import BitBoard
+from checkers import BLACK_PAWN, BLACK_KING, WHITE_PAWN, WHITE_KING
+from checkers import SQUARE_POSITIONS
+
+# Layout of a tablebase file: a header holding a magic string, the largest
+# number of pieces and the number of tables, a directory giving the
+# signature (black men, black kings, white men, white kings), the offset and
+# the size of each table, and the tables themselves. A table holds one byte
+# per position of its signature, see get_index(): 0 for a draw (or an
+# impossible position), distance + 1 otherwise, where distance is the number
+# of plies to the end of the game, odd for a win of the side to move and
+# even for a loss.
+HEADER = struct.Struct('<8sII')
+DIRECTORY = struct.Struct('<BBBBQQ')
+MAGIC = b'CKRTBL01'
+
+WIN, DRAW, LOSS = 1, 0, -1
+MAX_DISTANCE = 254
+
+# Men never stand on the row they are crowned on: black men are on the
+# squares 0 to 27 and white men on the squares 4 to 31.
+BLACK_MEN_SQUARES = list(range(0, 28))
+WHITE_MEN_SQUARES = list(range(4, 32))
+
+BINOMIALS = [[1] + [0] * 32 for n in range(33)]
+for n in range(1, 33):
+    for k in range(1, n + 1):
+        BINOMIALS[n][k] = BINOMIALS[n - 1][k - 1] + BINOMIALS[n - 1][k]
+
+def get_signatures(pieces):
+    """
+    Returns the signatures of the positions of at most the given number of
+    pieces where both sides have a piece, in the order they are solved in:
+    a capture or a promotion only leads to a signature solved before.
+    """
+    signatures = [s for s in itertools.product(range(pieces + 1), repeat = 4) \
+                  if s[0] + s[1] > 0 and s[2] + s[3] > 0 and sum(s) <= pieces]
+    return sorted(signatures, key = lambda s: (sum(s), s[0] + s[2], s))
+
+def get_size(signature):
+    """
+    Returns the number of entries of the table of the signature.
+    """
+    (bm, bk, wm, wk) = signature
+    return BINOMIALS[28][bm] * BINOMIALS[32][bk] * BINOMIALS[28][wm] \
+        * BINOMIALS[32][wk] * 2
+
+def get_squares(mask):
+    """
+    Returns the squares of the bits of the mask, in increasing order.
+    """
+    squares = []
+    while mask:
+        low = mask & -mask
+        squares.append(low.bit_length() - 1)
+        mask ^= low
+    return squares
+
+def get_signature(masks):
+    """
+    Returns the signature of the masks of a BitBoard.
+    """
+    return tuple([bin(mask).count('1') for mask in masks])
+
+def get_index(signature, masks, turn):
+    """
+    Returns the index of the position of the masks of a BitBoard with turn
+    to move in the table of its signature. Each group of pieces is ranked by
+    the combinatorial number system among the squares it can stand on, which
+    hashes the placements perfectly: the only unused entries are those where
+    two groups share a square.
+    """
+    (black_men, black_kings, white_men, white_kings) = masks
+    index = 0
+    for (mask, offset, count) in ((black_men, 0, 28), (black_kings, 0, 32), \
+                                  (white_men, 4, 28), (white_kings, 0, 32)):
+        rank = 0
+        for (i, square) in enumerate(get_squares(mask)):
+            rank += BINOMIALS[square - offset][i + 1]
+        index = index * BINOMIALS[count][bin(mask).count('1')] + rank
+    return index * 2 + (1 if turn == 'white' else 0)
+
+def decode(value):
+    """
+    Returns the (result, distance) of a table entry, where result is WIN,
+    DRAW or LOSS for the side to move.
+    """
+    if value == 0:
+        return (DRAW, 0)
+    distance = value - 1
+    return (WIN if distance % 2 else LOSS, distance)
+
+def get_placements(signature):
+    """
+    Yields the masks of every position of the signature.
+    """
+    (bm, bk, wm, wk) = signature
+    for black_men in itertools.combinations(BLACK_MEN_SQUARES, bm):
+        taken = set(black_men)
+        for black_kings in itertools.combinations(range(32), bk):
+            if taken.intersection(black_kings):
+                continue
+            taken_ = taken.union(black_kings)
+            for white_men in itertools.combinations(WHITE_MEN_SQUARES, wm):
+                if taken_.intersection(white_men):
+                    continue
+                taken__ = taken_.union(white_men)
+                for white_kings in itertools.combinations(range(32), wk):
+                    if taken__.intersection(white_kings):
+                        continue
+                    yield tuple([sum([1 << s for s in squares]) \
+                                 for squares in (black_men, black_kings, \
+                                                 white_men, white_kings)])
+
+def make_board(masks):
+    """
+    Returns the BitBoard of the masks.
+    """
+    board = BitBoard()
+    for (mask, piece) in zip(masks, (BLACK_PAWN, BLACK_KING, \
+                                     WHITE_PAWN, WHITE_KING)):
+        for square in get_squares(mask):
+            (row, col) = SQUARE_POSITIONS[square]
+            board.place(row, col, piece)
+    return board
+
+def solve(signature, tables):
+    """
+    Solves the positions of the signature by retrograde analysis, given the
+    tables of the signatures solved before, and returns its table.
+    Every move is generated once: the moves leaving the signature are looked
+    up in the other tables, and those staying in it are kept as edges from
+    the position reached to the position left. The positions are then
+    resolved by increasing distance, starting with those whose result only
+    depends on the other tables: a position reaching a lost one is won one
+    ply further, and a position whose moves all reach won ones is lost one
+    ply further than the farthest of them. The positions left are draws.
+    """
+    size = get_size(signature)
+    table = bytearray(size)
+    parents = {}
+    remaining = {}
+    farthest = {}
+    queue = {}
+    def schedule(index, result, distance):
+        if distance > MAX_DISTANCE:
+            raise ValueError("A distance of %d plies cannot be stored." \
+                             % distance)
+        queue.setdefault(distance, []).append((index, result))
+    for masks in get_placements(signature):
+        board = make_board(masks)
+        for turn in ('black', 'white'):
+            opponent = 'white' if turn == 'black' else 'black'
+            index = get_index(signature, masks, turn)
+            moves = ai.get_legal_moves(board, turn)
+            if not moves:
+                schedule(index, LOSS, 0)
+                continue
+            count, distance, won = 0, 0, False
+            for move in moves:
+                child = board.__copy__()
+                ai.make_move(child, move)
+                child_masks = child.get_masks()
+                child_signature = get_signature(child_masks)
+                if sum(child_signature[2:] if opponent == 'white' \
+                       else child_signature[:2]) == 0:
+                    (result, child_distance) = (LOSS, 0)
+                elif child_signature == signature:
+                    child_index = get_index(signature, child_masks, opponent)
+                    parents.setdefault(child_index, []).append(index)
+                    count += 1
+                    continue
+                else:
+                    (result, child_distance) = decode(tables[child_signature] \
+                        [get_index(child_signature, child_masks, opponent)])
+                if result == LOSS:
+                    schedule(index, WIN, child_distance + 1)
+                    won = True
+                elif result == WIN:
+                    distance = max(distance, child_distance)
+                else:
+                    won = True
+            if won:
+                # never lost: one move at least does better than a loss
+                count += 1
+            remaining[index] = count
+            farthest[index] = distance
+            if count == 0:
+                schedule(index, LOSS, distance + 1)
+    distance = 0
+    while queue:
+        for (index, result) in queue.pop(distance, []):
+            if table[index]:
+                continue
+            table[index] = distance + 1
+            for parent in parents.get(index, []):
+                if table[parent]:
+                    continue
+                if result == LOSS:
+                    schedule(parent, WIN, distance + 1)
+                else:
+                    remaining[parent] -= 1
+                    if remaining[parent] == 0:
+                        schedule(parent, LOSS, \
+                                 max(distance, farthest[parent]) + 1)
+        distance += 1
+    return table
+
+def build_tablebase(pieces, verbose = False):
+    """
+    Solves every signature of at most the given number of pieces and
+    returns the tables by signature.
+    """
+    tables = {}
+    for signature in get_signatures(pieces):
+        start = time.time()
+        tables[signature] = solve(signature, tables)
+        if verbose:
+            print("%s: %d entries in %.1fs" \
+                  % (signature, len(tables[signature]), time.time() - start))
+    return tables
+
+def write_tablebase(path, tables):
+    """
+    Writes the tables to a tablebase file with mapped.write_file().
+    """
+    signatures = sorted(tables)
+    offset = HEADER.size + len(signatures) * DIRECTORY.size
+    chunks = [HEADER.pack(MAGIC, max([sum(s) for s in signatures]), \
+                          len(signatures))]
+    for signature in signatures:
+        chunks.append(DIRECTORY.pack(*(signature \
+                                       + (offset, len(tables[signature])))))
+        offset += len(tables[signature])
+    for signature in signatures:
+        chunks.append(tables[signature])
+    mapped.write_file(path, chunks)
+
+class Tablebase(mapped.MappedFile):
+    """
+    A tablebase file mapped in memory: only its directory is read when it is
+    opened, and a probe reads a single byte of the mapping.
+    """
+
+    kind = 'a tablebase'
+
+    def __init__(self, path):
+        """
+        Maps the tablebase file at the given path. Raises a ValueError if it
+        is not a valid tablebase.
+        """
+        mapped.MappedFile.__init__(self, path, HEADER, MAGIC)
+        (self._pieces, count) = self._header
+        self.check(HEADER.size + count * DIRECTORY.size <= len(self._map))
+        self._offsets = {}
+        for i in range(count):
+            entry = DIRECTORY.unpack_from(self._map, \
+                                          HEADER.size + i * DIRECTORY.size)
+            self.check(entry[4] + entry[5] <= len(self._map) \
+                       and entry[5] == get_size(entry[:4]))
+            self._offsets[entry[:4]] = entry[4]
+
+    def get_max_pieces(self):
+        """
+        Returns the largest number of pieces of the positions of the tables.
+        """
+        return self._pieces
+
+    def probe(self, board, turn):
+        """
+        Returns the (result, distance) of the position of the BitBoard with
+        turn to move, where result is WIN, DRAW or LOSS for turn, or None if
+        the tables do not hold it.
+        """
+        masks = board.get_masks()
+        signature = get_signature(masks)
+        offset = self._offsets.get(signature)
+        if offset is None:
+            return None
+        return decode(self._map[offset + get_index(signature, masks, turn)])
+
+def get_tablebase():
+    """
+    Returns the Tablebase of config.tablebase (see mapped.open_file()), or
+    None if there is no such tablebase.
+    """
+    return mapped.open_file(Tablebase, config.tablebase)
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Builds the endgame tablebase of the positions of a few pieces.")
+    parser.add_argument('--pieces', type = int, default = 3)
+    parser.add_argument('--output', default = config.tablebase)
+    args = parser.parse_args()
+    start = time.time()
+    tables = build_tablebase(args.pieces, True)
+    write_tablebase(args.output, tables)
+    print("%d tables of up to %d pieces built in %.1fs, written to %s" \
+          % (len(tables), args.pieces, time.time() - start, args.output))
+    sys.exit(0)
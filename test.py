@@ -1,5 +1,29 @@
+import io
+import os
+import json
+import math
+import copy
+import struct
+import time
+import tempfile
+import threading
+import contextlib
+import http.server
+import concurrent.futures
+import requests
 import main
 import ai
+import book
+import client
+import config
+import smp
+import server
+import tablebase
+import tournament
+from checkers import BitBoard
+from checkers import SQUARE_POSITIONS
+from checkers import START_POSITION
+from checkers import BLACK_PAWN, BLACK_KING, WHITE_PAWN, WHITE_KING
 
 def convert_board(size, board):
     board = board.replace('\n', '')
@@ -25,6 +49,13 @@ def check_moves(moves, ground_truth):
         print("OK")
     return ok
 
+def check_failures(failures):
+    for failure in failures:
+        print("FAILED: " + failure)
+    if not failures:
+        print("OK")
+    return not failures
+
 def test_01_move_black_disc():
     board = convert_board(8, """
 ________
@@ -287,6 +318,715 @@ ____B___
     moves = ai.allowed_moves(board, 'b')
     return board, ground_truth, check_moves(moves, ground_truth)
 
+def test_16_bitboard_matches_board():
+    board = convert_board(8, """
+________
+b___b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = ai.Board(8)
+    ai.initialize(b, board)
+    ground_truth = ai.convert_positions(ai.get_hints(b, 'black'))
+    moves = ai.allowed_moves(board, 'b')
+    return board, ground_truth, check_moves(moves, ground_truth)
+
+def test_17_bitboard_api():
+    board = convert_board(8, """
+________
+________
+________
+__b_____
+________
+________
+_____w__
+________
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    if b.get(3, 2) is not BLACK_PAWN or b.is_free(3, 2):
+        failures.append("the black pawn is not at (3, 2)")
+    if b.get(6, 5) is not WHITE_PAWN or not b.is_free(4, 3):
+        failures.append("the white pawn is not at (6, 5)")
+    b.place(4, 3, BLACK_KING)
+    if b.get(4, 3) is not BLACK_KING:
+        failures.append("the black king was not placed at (4, 3)")
+    b.place(4, 3, WHITE_KING)
+    if b.get(4, 3) is not WHITE_KING:
+        failures.append("the black king was not replaced at (4, 3)")
+    b.remove(4, 3)
+    if b.get(4, 3) is not None or not b.is_free(4, 3):
+        failures.append("the king was not removed from (4, 3)")
+    try:
+        b.place(4, 4, BLACK_PAWN)
+        failures.append("a piece was placed on a light square")
+    except ValueError:
+        pass
+    for copier in (copy.copy, copy.deepcopy):
+        other = copier(b)
+        other.remove(3, 2)
+        other.place(0, 1, WHITE_PAWN)
+        if b.get(3, 2) is not BLACK_PAWN or not b.is_free(0, 1):
+            failures.append("%s shares the masks of the board" \
+                            % copier.__name__)
+        if other.get(0, 1) is not WHITE_PAWN or not other.is_free(3, 2):
+            failures.append("%s did not copy the board" % copier.__name__)
+    return board, [], check_failures(failures)
+
+def test_18_make_unmake_move():
+    board = convert_board(8, """
+________
+b_w_b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    state = (ai.get_rows(b), b.get_hash(), b.get_evaluation_terms())
+    failures = []
+    for color in ('black', 'white'):
+        for move in ai.get_legal_moves(b, color):
+            undo = ai.make_move(b, move)
+            fresh = BitBoard(8)
+            ai.initialize(fresh, ai.get_rows(b))
+            if (b.get_hash(), b.get_evaluation_terms()) \
+                    != (fresh.get_hash(), fresh.get_evaluation_terms()):
+                failures.append("make_move(%s) differs from a fresh board" \
+                                % (move, ))
+            ai.unmake_move(b, undo)
+            if (ai.get_rows(b), b.get_hash(), b.get_evaluation_terms()) \
+                    != state:
+                failures.append("unmake_move(%s) did not restore the " \
+                                "board" % (move, ))
+    return board, [], check_failures(failures)
+
+def test_19_book_format():
+    board = convert_board(8, """
+________
+b_w_b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    chain = tuple(SQUARE_POSITIONS[20:32])
+    moves = [chain, ((1, 0), (3, 2), (5, 0), (7, 2), (5, 4), (3, 2)), \
+             ((0, 1), (1, 0))]
+    for move in moves:
+        if book.unpack_move(book.pack_move(move)) != move:
+            failures.append("pack_move(%s) does not round-trip" % (move, ))
+    key = ai.transposition_key(b, 'black', 'black')
+    entries = {}
+    for (i, move) in enumerate(moves + ai.get_legal_moves(b, 'white')):
+        entries[key ^ i] = (move, 0.25 * i, i + 1)
+    path = os.path.join(tempfile.mkdtemp(), 'book.bin')
+    book.write_book(path, entries)
+    opening_book = book.OpeningBook(path)
+    try:
+        if len(opening_book) != len(entries):
+            failures.append("the book has %d entries instead of %d" \
+                            % (len(opening_book), len(entries)))
+        for (other, entry) in entries.items():
+            if opening_book.lookup(other) != entry:
+                failures.append("the entry of %d is %s instead of %s" \
+                                % (other, opening_book.lookup(other), entry))
+        if opening_book.lookup(1) is not None:
+            failures.append("the book has an entry for an unknown key")
+        if opening_book.probe(b, 'black') != entries[key]:
+            failures.append("probe() does not find the position")
+    finally:
+        opening_book.close()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    return board, [], check_failures(failures)
+
+def test_20_shared_table():
+    board = convert_board(8, """
+________
+________
+________
+__b_____
+________
+________
+_____w__
+________
+""")
+    failures = []
+    table = smp.SharedTranspositionTable(64)
+    try:
+        chain = tuple(SQUARE_POSITIONS[8:32])
+        entries = [(2 ** 64 - 1, 9, ai.LOWER, -1.5, chain), \
+                   (65, 3, ai.EXACT, 0.125, ((3, 2), (4, 1))), \
+                   (66, 0, ai.UPPER, 2.0, None)]
+        for (key, depth, bound, value, move) in entries:
+            table.store(key, depth, bound, value, move)
+            if table.probe(key) != (key, depth, bound, value, move, 0):
+                failures.append("the entry of %d is %s" \
+                                % (key, table.probe(key)))
+        if table.probe(1) is not None:
+            failures.append("a key got the entry of another key")
+        offset = smp.HEADER.size + (65 % 64) * smp.ENTRY.size \
+            + struct.calcsize('<QQ')
+        table._buffer[offset] ^= 1
+        if table.probe(65) is not None:
+            failures.append("an entry with a corrupted word was read back")
+    finally:
+        table.close()
+    return board, [], check_failures(failures)
+
+def test_21_tablebase():
+    board = convert_board(8, """
+________
+________
+________
+________
+________
+__b_____
+________
+w_______
+""")
+    tables = tablebase.build_tablebase(2)
+    def lookup(b, turn):
+        masks = b.get_masks()
+        signature = tablebase.get_signature(masks)
+        if sum(signature[:2] if turn == 'black' else signature[2:]) == 0:
+            return (tablebase.LOSS, 0)
+        value = tables[signature][tablebase.get_index(signature, masks, turn)]
+        return tablebase.decode(value)
+    failures = []
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    if lookup(b, 'white') != (tablebase.LOSS, 2):
+        failures.append("white to move does not lose in 2 plies")
+    ai.make_move(b, ((7, 0), (6, 1)))
+    if lookup(b, 'black') != (tablebase.WIN, 1):
+        failures.append("black to move does not win in 1 ply")
+    for signature in tables:
+        for masks in tablebase.get_placements(signature):
+            b = tablebase.make_board(masks)
+            for turn in ('black', 'white'):
+                opponent = 'white' if turn == 'black' else 'black'
+                (result, distance) = lookup(b, turn)
+                children = []
+                for move in ai.get_legal_moves(b, turn):
+                    child = b.__copy__()
+                    ai.make_move(child, move)
+                    children.append(lookup(child, opponent))
+                if result == tablebase.WIN:
+                    ok = (tablebase.LOSS, distance - 1) in children \
+                        and min([d for (r, d) in children \
+                                 if r == tablebase.LOSS]) == distance - 1
+                elif result == tablebase.LOSS:
+                    ok = all([r == tablebase.WIN for (r, d) in children]) \
+                        and max([0] + [d + 1 for (r, d) in children]) \
+                            == distance
+                else:
+                    ok = tablebase.LOSS not in [r for (r, d) in children] \
+                        and tablebase.DRAW in [r for (r, d) in children]
+                if not ok:
+                    failures.append("%s to move in %s is %s but its " \
+                                    "children are %s" % (turn, \
+                                    ai.get_rows(b), (result, distance), \
+                                    children))
+    return board, [], check_failures(failures[:10])
+
+def test_22_board_search():
+    board = convert_board(8, """
+________
+b___b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = ai.Board(8)
+    ai.initialize(b, board)
+    bitboard = BitBoard(8)
+    ai.initialize(bitboard, board)
+    failures = []
+    if b.get_hash() != bitboard.get_hash():
+        failures.append("the hash of the Board is not the one of a BitBoard")
+    for search in (ai.minimax_search, ai.alphabeta_search):
+        ai.transposition_table.clear()
+        expected = search((bitboard, 'white', 0), 4)
+        ai.transposition_table.clear()
+        result = search((b, 'white', 0), 4)
+        if result != expected:
+            failures.append("%s gives %s on a Board and %s on a BitBoard" \
+                            % (search.__name__, result, expected))
+    return board, [], check_failures(failures)
+
+def test_23_iterative_deepening_timeout():
+    board = convert_board(8, """
+_b_b_b_b
+b_b_b_b_
+_b_b_b_b
+________
+________
+w_w_w_w_
+_w_w_w_w
+w_w_w_w_
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    start = time.time()
+    (move, value, depth) = ai.iterative_deepening_search((b, 'black', 0), \
+        0.2, table = ai.TranspositionTable())
+    seconds = time.time() - start
+    if seconds > 1.0:
+        failures.append("a search of 0.2s took %.2fs" % seconds)
+    if depth < 1:
+        failures.append("no depth was completed")
+    expected = ai.iterative_deepening_search((b, 'black', 0), \
+        float('inf'), depth, table = ai.TranspositionTable())
+    if (move, value, depth) != expected:
+        failures.append("the search stopped at depth %d gives %s instead " \
+                        "of %s" % (depth, (move, value, depth), expected))
+    if ai.get_rows(b) != board:
+        failures.append("the board was changed by the search")
+    return board, [], check_failures(failures)
+
+def test_24_parallel_root_search():
+    board = convert_board(8, """
+________
+b___b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    for depth in (2, 4):
+        expected = ai.alphabeta_search((b, 'white', 0), depth, \
+            ai.SearchContext(ai.TranspositionTable()))
+        result = ai.parallel_alphabeta_search((b, 'white', 0), depth, 2, \
+            ai.SearchContext(ai.TranspositionTable()))
+        if result != expected:
+            failures.append("the parallel search to depth %d gives %s " \
+                            "instead of %s" % (depth, result, expected))
+    return board, [], check_failures(failures)
+
+def test_25_quiescence_search():
+    board = convert_board(8, """
+_b______
+________
+________
+__b_____
+___w____
+________
+________
+______w_
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    context = ai.SearchContext(ai.TranspositionTable())
+    stand_pat = ai.utility((b, 'black', 0))
+    value = ai.quiescence_maxvalue((b, 'black', 0), None, None, context)
+    ai.make_move(b, ((3, 2), (5, 4)))
+    expected = ai.utility((b, 'black', 1), {'white': 0})
+    if value != expected:
+        failures.append("the pending capture is valued %s instead of %s" \
+                        % (value, expected))
+    if value == stand_pat:
+        failures.append("the pending capture was not searched")
+    value = ai.quiescence_minvalue((b, 'white', 1), None, None, context)
+    if value != expected:
+        failures.append("a quiet position is valued %s instead of %s" \
+                        % (value, expected))
+    return board, [], check_failures(failures)
+
+def test_26_aspiration_window():
+    board = convert_board(8, """
+________
+b___b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    b = BitBoard(8)
+    ai.initialize(b, board)
+    failures = []
+    state = (b, 'white', 0)
+    (move, value) = ai.alphabeta_search(state, 4, \
+        ai.SearchContext(ai.TranspositionTable()))
+    low = ai.alphabeta_search(state, 4, \
+        ai.SearchContext(ai.TranspositionTable()), None, \
+        (value + 1.0, value + 2.0))[1]
+    if low > value + 1.0:
+        failures.append("a search failing low returns %s above alpha" % low)
+    high = ai.alphabeta_search(state, 4, \
+        ai.SearchContext(ai.TranspositionTable()), None, \
+        (value - 2.0, value - 1.0))[1]
+    if high < value - 1.0:
+        failures.append("a search failing high returns %s below beta" % high)
+    window = config.aspiration_window
+    results = []
+    try:
+        for width in (0, 1e-6):
+            config.aspiration_window = width
+            results.append(ai.iterative_deepening_search(state, \
+                float('inf'), 5, table = ai.TranspositionTable()))
+    finally:
+        config.aspiration_window = window
+    if results[0] != results[1]:
+        failures.append("the searches again after the aspiration windows " \
+                        "give %s instead of %s" % (results[1], results[0]))
+    return board, [], check_failures(failures)
+
+def test_27_engine_new_game():
+    board = convert_board(8, """
+________
+b___b___
+_w_w_w__
+________
+_w_w_W__
+________
+_W_w____
+____B___
+""")
+    failures = []
+    settings = (config.search_time_budget, config.search_max_depth, \
+                config.opening_book, config.ponder)
+    (config.search_time_budget, config.search_max_depth, \
+     config.opening_book, config.ponder) = (float('inf'), 4, None, False)
+    try:
+        engine = ai.Engine(ai.TranspositionTable())
+        b = BitBoard(8)
+        ai.initialize(b, board)
+        engine.get_next_move(b, 'white')
+        context = engine.context
+        (key, depth, move, expected) = engine.prediction
+        engine.get_next_move(expected, 'white')
+        if engine.hits != 1 or engine.context is not context:
+            failures.append("the expected position started a new game")
+        if engine.table.probe(key) is None:
+            failures.append("the table lost the position of the game")
+        start = BitBoard(8)
+        ai.initialize(start, START_POSITION)
+        engine.get_next_move(start, 'black')
+        if engine.hits != 0 or engine.context is context:
+            failures.append("the start position did not start a new game")
+        if engine.table.probe(key) is not None:
+            failures.append("the table kept the previous game")
+    finally:
+        (config.search_time_budget, config.search_max_depth, \
+         config.opening_book, config.ponder) = settings
+    return board, [], check_failures(failures)
+
+def test_28_stop_pondering():
+    board = convert_board(8, """
+_b_b_b_b
+b_b_b_b_
+_b_b_b_b
+________
+________
+w_w_w_w_
+_w_w_w_w
+w_w_w_w_
+""")
+    failures = []
+    settings = (config.search_time_budget, config.opening_book, \
+                config.ponder, config.ponder_time_budget)
+    (config.search_time_budget, config.opening_book, config.ponder, \
+     config.ponder_time_budget) = (0.1, None, True, 30.0)
+    try:
+        engine = ai.Engine(ai.TranspositionTable())
+        b = BitBoard(8)
+        ai.initialize(b, board)
+        engine.get_next_move(b, 'black')
+        if engine.pondering is None:
+            failures.append("the engine is not pondering")
+        else:
+            thread = engine.pondering[2]
+            start = time.time()
+            engine.stop_pondering()
+            if thread.is_alive() or engine.pondering is not None:
+                failures.append("stop_pondering() left the thread running")
+            if time.time() - start > 1.0:
+                failures.append("stop_pondering() took %.2fs" \
+                                % (time.time() - start))
+    finally:
+        (config.search_time_budget, config.opening_book, config.ponder, \
+         config.ponder_time_budget) = settings
+    return board, [], check_failures(failures)
+
+def test_29_search_stats():
+    board = list(START_POSITION)
+    failures = []
+    settings = (config.search_time_budget, config.search_max_depth, \
+                config.opening_book, config.ponder, config.search_stats)
+    (config.search_time_budget, config.search_max_depth, \
+     config.opening_book, config.ponder, config.search_stats) = \
+        (float('inf'), 4, None, False, True)
+    try:
+        b = BitBoard(8)
+        ai.initialize(b, board)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            ai.get_next_move(b, 'black')
+        stats = ai.last_search_stats
+        if "Search stats: " not in output.getvalue():
+            failures.append("the stats were not printed")
+        if stats is None or stats.depth != 4:
+            failures.append("the search did not fill in its stats")
+        else:
+            for name in ('nodes', 'tt_hits', 'first_move_cutoffs'):
+                if getattr(stats, name) <= 0:
+                    failures.append("no %s were counted" % name)
+    finally:
+        (config.search_time_budget, config.search_max_depth, \
+         config.opening_book, config.ponder, config.search_stats) = settings
+    return board, [], check_failures(failures)
+
+def test_30_client():
+    board = list(START_POSITION)
+    failures = []
+    received = []
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        def log_message(self, format, *args):
+            pass
+        def reply(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def do_GET(self):
+            received.append((self.path, self.client_address))
+            if self.path == '/flaky' and len(received) == 1:
+                self.reply(503, b'{"error": "Unavailable"}')
+            elif self.path == '/broken':
+                self.reply(500, b'{"error": "Broken"}')
+            elif self.path == '/garbled':
+                self.reply(200, b'not json')
+            else:
+                self.reply(200, b'{"ok": true}')
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            received.append((self.path, self.client_address))
+            self.reply(200, b'{"error": "InvalidMove"}')
+    stub = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = stub.serve_forever)
+    thread.start()
+    url = 'http://127.0.0.1:%d' % stub.server_address[1]
+    backoff = config.http_backoff
+    config.http_backoff = 0
+    client.session = None
+    try:
+        if client.send_request(url + '/flaky', 'get') != {'ok': True}:
+            failures.append("the GET was not retried after a 503")
+        if [path for (path, _) in received] != ['/flaky', '/flaky']:
+            failures.append("the received were %s" % received)
+        client.send_request(url + '/ok', 'get')
+        if len(set([address for (_, address) in received])) != 1:
+            failures.append("the connection was not reused")
+        for (path, method, data, error) in \
+                [('/move', 'post', {'move': [1, 2]}, 'InvalidMove'), \
+                 ('/broken', 'get', {}, 'Broken'), \
+                 ('/garbled', 'get', {}, 'Could not decode response')]:
+            try:
+                client.send_request(url + path, method, data)
+                failures.append("%s did not raise" % path)
+            except main.InvalidMoveException:
+                if error != 'InvalidMove':
+                    failures.append("%s raised an invalid move" % path)
+            except Exception as e:
+                if str(e) != error:
+                    failures.append("%s raised %s" % (path, e))
+        if [path for (path, _) in received].count('/move') != 1:
+            failures.append("the POST was sent again")
+    finally:
+        config.http_backoff = backoff
+        client.get_session().close()
+        client.session = None
+        stub.shutdown()
+        stub.server_close()
+        thread.join()
+    return board, [], check_failures(failures)
+
+def test_31_game_pool():
+    board = list(START_POSITION)
+    failures = []
+    (budget, opening_book, ponder) = (config.search_time_budget, \
+                                      config.opening_book, config.ponder)
+    (config.search_time_budget, config.opening_book, config.ponder) = \
+        (0.05, None, False)
+    try:
+        pids = [ai.get_game_pool(id, 2).submit(os.getpid).result() \
+                for id in (1, 2, 3, 1)]
+        if pids[0] != pids[2] or pids[0] != pids[3] or pids[0] == pids[1]:
+            failures.append("the games were played by the processes %s" \
+                            % pids)
+        pool = ai.get_game_pool(5, 2)
+        move = pool.submit(ai.engine_move, 5, board, 'b').result()
+        if move not in ai.allowed_moves(board, 'b'):
+            failures.append("the engine played %s" % move)
+    finally:
+        (config.search_time_budget, config.opening_book, config.ponder) = \
+            (budget, opening_book, ponder)
+        for pool in ai.game_pools:
+            pool.shutdown()
+        ai.game_pools = []
+    return board, [], check_failures(failures)
+
+def test_32_game_server():
+    board = convert_board(8, """
+________
+________
+_b______
+__w_____
+________
+________
+________
+________
+""")
+    failures = []
+    game_server = server.GameServer(('127.0.0.1', 0))
+    thread = threading.Thread(target = game_server.serve_forever)
+    thread.start()
+    url = 'http://127.0.0.1:%d/checkers/games' \
+        % game_server.server_address[1]
+    def post(url, data):
+        response = requests.post(url, json = data)
+        return (response.status_code, response.json())
+    try:
+        game = main.send_request(url, 'post', \
+                                 {'name': 'x', 'size': 8, 'color': 'b'})
+        if game['board'] != START_POSITION:
+            failures.append("the game started on %s" % game['board'])
+        move = [list(p) for p in ai.allowed_moves(game['board'], 'b')[0]]
+        response = main.send_request(url + '/%d' % game['id'], 'post', \
+                                     {'move': move})
+        if response['board_after_candidate_move'] \
+                != server.apply_move(game['board'], move) \
+                or response['over'] or 'move' not in response:
+            failures.append("the form move gave %s" % response)
+        move = [list(p) for p in ai.allowed_moves(response['board'], 'b')[0]]
+        (status, response) = post(url + '/%d' % game['id'], {'move': move})
+        if status != 200 or 'move' not in response:
+            failures.append("the JSON move gave %d %s" % (status, response))
+        try:
+            main.send_request(url + '/%d' % game['id'], 'post', \
+                              {'move': [[0, 0], [1, 1]]})
+            failures.append("an invalid move was played")
+        except main.InvalidMoveException:
+            pass
+        if post(url + '/999', {'move': move}) \
+                != (404, {'error': 'Unknown game'}):
+            failures.append("an unknown game was found")
+        if post(url + '/%d' % game['id'], [move])[0] != 400:
+            failures.append("a body that is not an object was accepted")
+        game_server.get_game(game['id']).board = board
+        (status, response) = post(url + '/%d' % game['id'], \
+                                  {'move': [[2, 1], [4, 3]]})
+        if (status, response.get('over'), response.get('winner')) \
+                != (200, True, 'b'):
+            failures.append("the last capture gave %d %s" \
+                            % (status, response))
+        if game_server.get_game(game['id']) is not None:
+            failures.append("the game is still in progress")
+    finally:
+        game_server.shutdown()
+        game_server.server_close()
+        thread.join()
+    return board, [], check_failures(failures)
+
+def test_33_sprt():
+    board = list(START_POSITION)
+    failures = []
+    def make_sprt(results):
+        sprt = tournament.SPRT(-10.0, 0.0)
+        for result in results:
+            sprt.record(result)
+        return sprt
+    (s0, s1) = (tournament.get_score(-10.0), tournament.get_score(0.0))
+    if make_sprt([]).get_llr() != 0.0:
+        failures.append("the LLR of no games is not 0")
+    wins = make_sprt([tournament.WIN] * 10).get_llr()
+    if abs(wins - 10 * (s1 - s0) * (2 - s0 - s1) / (1.0 / 11)) > 1e-9:
+        failures.append("the LLR of 10 wins is %f" % wins)
+    losses = make_sprt([tournament.LOSS] * 10).get_llr()
+    if abs(losses + 10 * (s1 - s0) * (s0 + s1) / (1.0 / 11)) > 1e-9:
+        failures.append("the LLR of 10 losses is %f" % losses)
+    draws = make_sprt([tournament.DRAW] * 100).get_llr()
+    if abs(draws - 200 * 101 * (s1 - s0) * (1 - s0 - s1)) > 1e-9:
+        failures.append("the LLR of 100 draws is %f" % draws)
+    for (result, decision, bound) in \
+            [(tournament.WIN, 'H1', math.log(0.95 / 0.05)), \
+             (tournament.LOSS, 'H0', math.log(0.05 / 0.95)), \
+             (tournament.DRAW, 'H1', math.log(0.95 / 0.05))]:
+        sprt = make_sprt([])
+        llr = 0.0
+        while sprt.get_decision() is None and sprt.get_games() < 10000:
+            llr = sprt.get_llr()
+            sprt.record(result)
+        if sprt.get_decision() != decision \
+                or abs(llr) >= abs(bound) or abs(sprt.get_llr()) < abs(bound):
+            failures.append("%s results decided %s after %d games" \
+                            % (tournament.RESULTS[result], \
+                               sprt.get_decision(), sprt.get_games()))
+    return board, [], check_failures(failures)
+
+def stub_play_game(board, color, players, max_plies):
+    """
+    Replaces tournament.play_game() in test_34_tournament_scores(): B wins
+    every game.
+    """
+    result = tournament.WIN if players['b'][0] == 'B' else tournament.LOSS
+    return (result, 1)
+
+def test_34_tournament_scores():
+    board = list(START_POSITION)
+    failures = []
+    (play_game, get_search_pool) = (tournament.play_game, ai.get_search_pool)
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    tournament.play_game = stub_play_game
+    ai.get_search_pool = lambda workers: executor
+    try:
+        openings = tournament.get_openings(1)
+        log = io.StringIO()
+        sprt = tournament.run_tournament(openings, {}, {}, 6, 1, \
+                                         tournament.SPRT(-10.0, 0.0), log)
+        lines = [json.loads(line) for line in log.getvalue().splitlines()]
+        if (sprt.wins, sprt.draws, sprt.losses) != (6, 0, 0):
+            failures.append("B scored %s" % sprt.as_dict())
+        if sorted([(line['black'], line['result'], line['score_b']) \
+                   for line in lines[:-1]]) \
+                != [('A', '0-1', 1.0)] * 3 + [('B', '1-0', 1.0)] * 3:
+            failures.append("the games were logged as %s" % lines[:-1])
+        if lines[-1]['summary']['games'] != 6:
+            failures.append("the summary is %s" % lines[-1])
+    finally:
+        (tournament.play_game, ai.get_search_pool) = \
+            (play_game, get_search_pool)
+        executor.shutdown()
+    return board, [], check_failures(failures)
+
 
 ###############################################################################
 
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import concurrent.futures
+
+import ai
+import book
+import config
+from server import MAX_PLIES
+from checkers import BitBoard
+
+# The results of a game, for black, and their notations.
+WIN, DRAW, LOSS = 1.0, 0.5, 0.0
+RESULTS = {WIN: '1-0', DRAW: '1/2-1/2', LOSS: '0-1'}
+
+# The settings of every engine of a tournament: the games use all the cores,
+# so a search neither ponders nor uses several processes.
+ENGINE_SETTINGS = {'ponder': False, 'search_workers': 1, 'lazy_smp': False}
+
+def check_settings(settings):
+    """
+    Raises a ValueError unless every setting names an attribute of config,
+    or of ai with an 'ai.' prefix.
+    """
+    for name in settings:
+        (module, attribute) = (ai, name[3:]) if name.startswith('ai.') \
+            else (config, name)
+        if not hasattr(module, attribute):
+            raise ValueError("Unknown setting %s." % name)
+
+def apply_settings(settings):
+    """
+    Sets the attributes of config and ai named by the settings, and returns
+    the settings restoring their previous values.
+    """
+    previous = {}
+    for (name, value) in settings.items():
+        (module, attribute) = (ai, name[3:]) if name.startswith('ai.') \
+            else (config, name)
+        previous[name] = getattr(module, attribute)
+        setattr(module, attribute, value)
+    return previous
+
+# The engines of the games played by a process, by name, each one with its
+# own transposition table.
+engines = {}
+
+def play_game(board, color, players, max_plies = MAX_PLIES):
+    """
+    Plays a game from the position of the board (a list of strings) with
+    color to move. players maps 'b' and 'w' to the (name, settings) of the
+    engine playing that color, which thinks with its settings applied.
+    Returns the (result for black, plies) of the game: the side to move
+    without any move loses, and the game is drawn after max_plies plies.
+    """
+    b = BitBoard(len(board))
+    ai.initialize(b, board)
+    for (name, settings) in players.values():
+        if name not in engines:
+            engines[name] = ai.Engine(ai.TranspositionTable())
+        engines[name].new_game()
+    for plies in range(max_plies):
+        turn = 'black' if color == 'b' else 'white'
+        if not ai.get_legal_moves(b, turn):
+            return (LOSS if color == 'b' else WIN, plies)
+        (name, settings) = players[color]
+        previous = apply_settings(settings)
+        try:
+            move = engines[name].get_next_move(b, turn)[0]
+        finally:
+            apply_settings(previous)
+        ai.make_move(b, move)
+        color = 'w' if color == 'b' else 'b'
+    return (DRAW, max_plies)
+
+def read_openings(path):
+    """
+    Reads a file of opening positions, one JSON object per line with the
+    board (a list of strings) and the color to move ('b' or 'w').
+    """
+    openings = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                opening = json.loads(line)
+                openings.append((opening['board'], opening['color']))
+    return openings
+
+def get_openings(plies):
+    """
+    Returns the positions reached from the start position in at most the
+    given number of plies (see book.get_positions()), as (board, color) in
+    a stable order.
+    """
+    return [(ai.get_rows(board), turn[0]) for (key, board, turn) in \
+            sorted(book.get_positions(plies), key = lambda p: p[0])]
+
+class SPRT(object):
+    """
+    The sequential probability ratio test of the score of the second engine
+    against the first one: H0 is an Elo difference of elo0 and H1 one of
+    elo1, tested with the error rates alpha and beta. The log-likelihood
+    ratio is the normal approximation of the one of the win, draw and loss
+    counts used by Fishtest.
+    """
+
+    """ The wins and the losses added to the games in the variance. """
+    prior = 0.5
+
+    def __init__(self, elo0, elo1, alpha = 0.05, beta = 0.05):
+        self.score0 = get_score(elo0)
+        self.score1 = get_score(elo1)
+        self.lower = math.log(beta / (1.0 - alpha))
+        self.upper = math.log((1.0 - beta) / alpha)
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def record(self, score):
+        """
+        Records a game scored 1, 0.5 or 0 by the second engine.
+        """
+        if score == WIN:
+            self.wins += 1
+        elif score == DRAW:
+            self.draws += 1
+        else:
+            self.losses += 1
+
+    def get_games(self):
+        """
+        Returns the number of games recorded.
+        """
+        return self.wins + self.draws + self.losses
+
+    def get_score(self):
+        """
+        Returns the mean score of the second engine.
+        """
+        games = self.get_games()
+        return (self.wins + 0.5 * self.draws) / games if games else 0.5
+
+    def get_elo(self):
+        """
+        Returns the Elo difference of the mean score, the score being
+        bounded to [0.001, 0.999].
+        """
+        score = min(max(self.get_score(), 1e-3), 1.0 - 1e-3)
+        return -400.0 * math.log10(1.0 / score - 1.0)
+
+    def get_llr(self):
+        """
+        Returns the log-likelihood ratio of H1 against H0. The variance of
+        the score counts prior more wins and losses, so that it is never 0:
+        a run of draws alone then tends to the hypothesis closer to an even
+        score instead of never being decided.
+        """
+        games = self.get_games()
+        if games == 0:
+            return 0.0
+        score = self.get_score()
+        variance = ((self.wins + self.prior) * (1.0 - score) ** 2 \
+                    + self.draws * (0.5 - score) ** 2 \
+                    + (self.losses + self.prior) * score ** 2) \
+            / (games + 2 * self.prior)
+        return games * (self.score1 - self.score0) \
+            * (2 * score - self.score0 - self.score1) / (2 * variance)
+
+    def get_decision(self):
+        """
+        Returns 'H1' or 'H0' once the test accepts it, or None.
+        """
+        llr = self.get_llr()
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+    def as_dict(self):
+        """
+        Returns the state of the test, ready to be dumped as JSON.
+        """
+        return {
+            'games': self.get_games(),
+            'wins': self.wins,
+            'draws': self.draws,
+            'losses': self.losses,
+            'score': round(self.get_score(), 4),
+            'elo': round(self.get_elo(), 1),
+            'llr': round(self.get_llr(), 3),
+            'bounds': [round(self.lower, 3), round(self.upper, 3)],
+            'decision': self.get_decision(),
+        }
+
+def get_score(elo):
+    """
+    Returns the expected score of an Elo difference.
+    """
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+def run_tournament(openings, settings_a, settings_b, games, workers, sprt, \
+                   log, max_plies = MAX_PLIES):
+    """
+    Plays at most games games between the engines A and B with the given
+    settings over workers processes of ai.get_search_pool(), each opening
+    being played twice with the colors swapped. An opening is never played
+    again, since two searches to a fixed depth replay the same game: the
+    tournament plays at most 2 * len(openings) games. Every game is written
+    to the log as a JSON line as soon as it ends, and the tournament stops
+    once the SPRT accepts a hypothesis. Returns the SPRT.
+    """
+    def get_game(index):
+        (board, color) = openings[index // 2]
+        a_color = 'b' if index % 2 == 0 else 'w'
+        b_color = 'w' if a_color == 'b' else 'b'
+        players = {a_color: ('A', settings_a), b_color: ('B', settings_b)}
+        return (board, color, players, max_plies)
+    games = min(games, 2 * len(openings))
+    pool = ai.get_search_pool(workers)
+    pending = {}
+    index = 0
+    start = time.time()
+    try:
+        while index < games or pending:
+            while index < games and len(pending) < 2 * workers:
+                future = pool.submit(play_game, *get_game(index))
+                pending[future] = (index, time.time())
+                index += 1
+            done = concurrent.futures.wait(pending, return_when = \
+                concurrent.futures.FIRST_COMPLETED)[0]
+            for future in done:
+                (game, started) = pending.pop(future)
+                (result, plies) = future.result()
+                players = get_game(game)[2]
+                score = result if players['b'][0] == 'B' else 1.0 - result
+                sprt.record(score)
+                log.write(json.dumps({
+                    'game': game,
+                    'opening': game // 2,
+                    'black': players['b'][0],
+                    'result': RESULTS[result],
+                    'score_b': score,
+                    'plies': plies,
+                    'seconds': round(time.time() - started, 2),
+                }, sort_keys = True) + '\n')
+                log.flush()
+            if sprt.get_decision() is not None:
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+    summary = sprt.as_dict()
+    summary['seconds'] = round(time.time() - start, 2)
+    summary['games_per_hour'] = \
+        round(3600.0 * sprt.get_games() / max(summary['seconds'], 1e-3), 1)
+    log.write(json.dumps({'summary': summary}, sort_keys = True) + '\n')
+    log.flush()
+    return sprt
+
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = \
+        "Plays the engine B against the engine A from opening positions "
+        "with the colors swapped, until a sequential probability ratio test "
+        "accepts that B is elo1 or elo0 Elo stronger than A, and logs the "
+        "games as JSON lines.")
+    parser.add_argument('--engine-a', type = json.loads, default = {}, \
+                        help = "the settings of A, a JSON object mapping "
+                        "config attributes (or ai attributes prefixed with "
+                        "'ai.') to values")
+    parser.add_argument('--engine-b', type = json.loads, default = {}, \
+                        help = "the settings of B, as those of A")
+    parser.add_argument('--openings', help = "a file of opening positions, "
+                        "one JSON object per line with the board and the "
+                        "color to move (the positions after --opening-plies "
+                        "plies by default)")
+    parser.add_argument('--opening-plies', type = int, default = 6, \
+                        help = "the depth of the default openings: 6 plies "
+                        "give 12916 of them, i.e. 25832 games, enough for "
+                        "the SPRT of the default Elo bounds, which usually "
+                        "takes a few thousand games to decide, while 3 "
+                        "plies only give 546 games")
+    parser.add_argument('--games', type = int, \
+                        help = "the largest number of games, at most twice "
+                        "the number of openings (the default)")
+    parser.add_argument('--workers', type = int, \
+                        default = os.cpu_count() or 1)
+    parser.add_argument('--time-budget', type = float, default = 0.1, \
+                        help = "the thinking time of a move")
+    parser.add_argument('--depth', type = int, \
+                        help = "search to this depth instead of for "
+                        "--time-budget seconds")
+    parser.add_argument('--max-plies', type = int, default = MAX_PLIES, \
+                        help = "the number of plies of a drawn game")
+    parser.add_argument('--elo0', type = float, default = -10.0)
+    parser.add_argument('--elo1', type = float, default = 0.0)
+    parser.add_argument('--alpha', type = float, default = 0.05)
+    parser.add_argument('--beta', type = float, default = 0.05)
+    parser.add_argument('--log', help = "the JSON lines log (the standard "
+                        "output by default)")
+    args = parser.parse_args()
+    settings = dict(ENGINE_SETTINGS)
+    if args.depth is not None:
+        settings.update(search_time_budget = float('inf'), \
+                        search_max_depth = args.depth)
+    else:
+        settings.update(search_time_budget = args.time_budget)
+    try:
+        check_settings(args.engine_a)
+        check_settings(args.engine_b)
+    except ValueError as e:
+        parser.error(str(e))
+    openings = read_openings(args.openings) if args.openings \
+        else get_openings(args.opening_plies)
+    if args.games is None:
+        args.games = 2 * len(openings)
+    elif args.games > 2 * len(openings):
+        parser.error("%d openings only give %d games, use more of them "
+                     "(see --openings and --opening-plies)." \
+                     % (len(openings), 2 * len(openings)))
+    log = open(args.log, 'a') if args.log else sys.stdout
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    run_tournament(openings, dict(settings, **args.engine_a), \
+                   dict(settings, **args.engine_b), args.games, \
+                   args.workers, sprt, log, args.max_plies)
+    if log is not sys.stdout:
+        log.close()
+    sys.stderr.write("%s\n" % json.dumps(sprt.as_dict(), sort_keys = True))
+    sys.exit(0)